@@ -0,0 +1,160 @@
+"""
+白黒2値とみなせるページ（文字ページなど）を検出し、CCITT Group 4 圧縮のTIFFに変換する共通モジュール
+
+img2pdf は単一ストリップの Group 4 TIFF を再圧縮せずにPDFへ埋め込む。
+
+dependencies:
+    uv add pillow
+"""
+import io
+import logging
+from pathlib import Path
+from PIL import ImageOps
+
+import grayscale
+
+logger = logging.getLogger(__name__)
+
+# この値以下の輝度を黒付近、LIGHT_LIMIT 以上を白付近とみなす
+DARK_LIMIT = 64
+LIGHT_LIMIT = 192
+
+# 黒付近・白付近の画素の割合がこの値以上の画像を2値と判定する
+DEFAULT_MIN_BILEVEL_RATIO = 0.97
+
+# 有彩色の画素の割合がこの値を超える画像は2値化しない
+DEFAULT_MAX_COLOR_RATIO = 0.01
+
+# 全体を1ストリップで保存するためのストリップサイズ
+SINGLE_STRIP_SIZE = 2 ** 31 - 1
+
+
+def bilevel_ratio(histogram: list[int]) -> float:
+    """
+    輝度ヒストグラムから、黒付近または白付近の画素の割合を求める。
+    """
+    total = sum(histogram)
+    if total == 0:
+        return 0.0
+    return (sum(histogram[:DARK_LIMIT + 1]) + sum(histogram[LIGHT_LIMIT:])) / total
+
+
+def otsu_threshold(histogram: list[int]) -> int:
+    """
+    輝度ヒストグラムから大津の方法で2値化のしきい値を求める。
+    """
+    total = sum(histogram)
+    sum_all = sum(value * count for value, count in enumerate(histogram))
+    sum_background = 0
+    weight_background = 0
+    best_threshold = 128
+    best_variance = -1.0
+    for value, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += value * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = value
+    return best_threshold
+
+
+def convert_image(source, name: str, min_bilevel_ratio: float = DEFAULT_MIN_BILEVEL_RATIO,
+                  max_color_ratio: float = DEFAULT_MAX_COLOR_RATIO,
+                  tolerance: int = grayscale.DEFAULT_TOLERANCE) -> tuple[bytes | None, dict]:
+    """
+    画像が2値とみなせるかを判定し、該当する場合は2値化して Group 4 圧縮のTIFFに変換する。
+
+    有彩色の判定は縮小デコードした画像で行う。縮小すると文字の輪郭が中間調になり2値の割合を過小評価するため、
+    2値の判定はフル解像度の輝度のヒストグラムで行い、同じ画像をそのまま2値化する。
+    変換後のサイズが元より大きくなる場合は採用しない。
+
+    Args:
+        source (bytes | Path): 画像データまたは画像ファイルのパス。
+        name (str): レポートに記載する名前。
+        min_bilevel_ratio (float): 2値と判定する黒付近・白付近の画素の割合の下限。
+        max_color_ratio (float): 2値化する有彩色の画素の割合の上限。
+        tolerance (int): 無彩色とみなす色差の上限。
+
+    Returns:
+        tuple[bytes | None, dict]: (Group 4 TIFF のデータ、変換しない場合は None, レポート)。
+    """
+    original_size = source.stat().st_size if isinstance(source, Path) else len(source)
+    report = {"name": name, "decision": "", "bilevel_ratio": "", "threshold": "", "original_size": original_size,
+              "new_size": original_size}
+
+    with grayscale.open_source(source) as img:
+        small = grayscale.downsample(img)
+
+    if grayscale.color_ratio(small, tolerance) > max_color_ratio:
+        report["decision"] = "color"
+        return None, report
+
+    with grayscale.open_source(source) as img:
+        # JPEGは色差をデコードせず、輝度のみをフル解像度でデコードする
+        img.draft("L", img.size)
+        dpi = img.info.get("dpi", (72, 72))
+        # TIFF には EXIF を引き継がないため、Orientation に従って回転してから2値化する
+        gray = ImageOps.exif_transpose(img).convert("L")
+        if gray.size != img.size:
+            dpi = dpi[::-1]
+
+    histogram = gray.histogram()
+    ratio = bilevel_ratio(histogram)
+    report["bilevel_ratio"] = f"{ratio:.6f}"
+    if ratio < min_bilevel_ratio:
+        report["decision"] = "photo"
+        return None, report
+
+    threshold = otsu_threshold(histogram)
+    report["threshold"] = threshold
+
+    lut = [0 if value <= threshold else 255 for value in range(256)]
+    bilevel = gray.point(lut, mode="1")
+    buffer = io.BytesIO()
+    # img2pdf が再圧縮せずに埋め込めるよう、1ストリップで保存する
+    bilevel.save(buffer, format="TIFF", compression="group4", strip_size=SINGLE_STRIP_SIZE, dpi=dpi)
+    data = buffer.getvalue()
+
+    if len(data) >= original_size:
+        report["decision"] = "bilevel_kept"
+        return None, report
+
+    report["decision"] = "converted"
+    report["new_size"] = len(data)
+    return data, report
+
+
+def convert_images(items: list[tuple[str, bytes | Path]], workers: int | None = None,
+                   **options) -> tuple[list[bytes | None], list[dict]]:
+    """
+    複数の画像の2値判定と Group 4 変換をプロセスプールで行う。
+
+    Args:
+        items (list[tuple[str, bytes | Path]]): (名前, 画像データまたは画像ファイルのパス) のリスト。
+        workers (int | None): ワーカープロセス数。None の場合はCPU数。
+        **options: convert_image に渡すオプション。
+
+    Returns:
+        tuple[list[bytes | None], list[dict]]: 入力と同じ順序の、変換結果とレポートのリスト。
+    """
+    return grayscale.convert_images(items, workers=workers, converter=convert_image, label="白黒2値（Group 4）",
+                                    **options)
+
+
+def add_bilevel_arguments(parser):
+    """
+    2値化用のコマンドライン引数を追加する。
+    """
+    parser.add_argument("--bilevel", action="store_true",
+                        help="白黒2値とみなせるページを2値化し、CCITT Group 4 圧縮で埋め込む。")
+    parser.add_argument("--bilevel-ratio", type=float, default=DEFAULT_MIN_BILEVEL_RATIO,
+                        help=f"2値と判定する黒付近・白付近の画素の割合の下限（初期値: {DEFAULT_MIN_BILEVEL_RATIO}）。")
+    parser.add_argument("--bilevel-report", type=Path, default=None, help="2値判定のレポート（CSV）の出力先。")
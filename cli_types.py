@@ -0,0 +1,22 @@
+"""
+コマンドライン引数の値を検証する共通モジュール
+
+argparse の type に指定して使用する。
+"""
+import argparse
+
+
+def positive_int(value: str) -> int:
+    """
+    1以上の整数に変換する。
+
+    Raises:
+        argparse.ArgumentTypeError: 整数でない場合、または1未満の場合。
+    """
+    try:
+        number = int(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"整数を指定してください: {value}") from e
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"1以上の整数を指定してください: {value}")
+    return number
@@ -0,0 +1,581 @@
+"""
+EPUB→PDF、PDF→画像、HTML→画像の変換をHTTPで提供するローカルサーバー
+
+エンドポイント:
+    POST /convert/epub2pdf      EPUBファイルをPDFに変換する（クエリ: dpi, skip_cover, pages, linearize, dedup）
+    POST /convert/pdf2images    PDFファイルから画像を抽出してZIPで返す（クエリ: pages）
+    POST /convert/html2images   Impress Web Book Viewer のHTMLから画像を抽出してZIPで返す
+    GET  /jobs/<ジョブID>         非同期ジョブの状態を返す
+    GET  /jobs/<ジョブID>/result  非同期ジョブの結果を返す
+    GET  /metrics               処理件数やキューの状況を返す
+
+リクエストボディにはファイルの内容をそのまま送信する。
+クエリに async=1 を指定するとジョブIDを返し、指定しない場合は変換結果をそのまま返す。
+
+dependencies:
+    uv add img2pdf pikepdf PyMuPDF
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import epub2img
+import html2img_impress
+import images2pdf
+import pdf2img
+from converter_errors import ConverterError, InputNotFoundError, InvalidInputError, JobLimitError, NoImagesFoundError
+from page_range import parse_page_spec
+
+try:
+    import resource  # Unix のみ
+except ImportError:
+    resource = None
+
+# ログ設定
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%H:%M:%S"
+)
+logger = logging.getLogger(__name__)
+
+# レスポンスを書き出す単位
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# リクエストヘッダーの最大サイズ
+MAX_HEADER_SIZE = 64 * 1024
+
+# 完了したジョブの結果を保持する秒数
+JOB_RESULT_TTL = 600
+
+# HTTPステータスの説明
+HTTP_REASONS = {
+    200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error",
+    503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+
+# --- ワーカープロセス側の処理 ---
+
+def _init_worker(memory_limit_mb: int | None):
+    """
+    （ワーカープロセス）メモリ上限を設定する。変換用ライブラリはこのモジュールの読み込み時にインポート済みとなる。
+    """
+    # Ctrl+C はサーバー側で処理する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _warm_up() -> int:
+    """
+    （ワーカープロセス）プロセスを起動させておくための処理。強制終了に使用するプロセスIDを返す。
+    """
+    return os.getpid()
+
+
+class _TimeLimitExceeded(BaseException):
+    """
+    （ワーカープロセス）処理時間の上限を超えたことを示す。
+
+    変換処理内の except Exception で捕捉されて処理が続行されないよう、BaseException を継承する。
+    """
+
+
+def _raise_time_limit(signum, frame):
+    raise _TimeLimitExceeded()
+
+
+def _convert_epub2pdf(input_path: Path, params: dict) -> tuple[str, str, bytes]:
+    images = epub2img.iter_images(input_path, skip_cover=params.get("skip_cover", False), pages=params.get("pages"))
+    buffer = io.BytesIO()
+    images2pdf.build_pdf(images, buffer, dpi=params.get("dpi", 72), linearize=params.get("linearize", False),
+                         dedup=params.get("dedup", False))
+    return "application/pdf", "output.pdf", buffer.getvalue()
+
+
+def _zip_images(images) -> tuple[str, str, bytes]:
+    # 画像は圧縮済みのため無圧縮で格納する
+    buffer = io.BytesIO()
+    count = 0
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as z:
+        for _, name, data in images:
+            z.writestr(name, data)
+            count += 1
+    if count == 0:
+        raise NoImagesFoundError("画像が見つかりませんでした。")
+    return "application/zip", "images.zip", buffer.getvalue()
+
+
+def _convert_pdf2images(input_path: Path, params: dict) -> tuple[str, str, bytes]:
+    return _zip_images(pdf2img.iter_images(input_path, pages=params.get("pages")))
+
+
+def _convert_html2images(input_path: Path, params: dict) -> tuple[str, str, bytes]:
+    return _zip_images(html2img_impress.iter_images(input_path))
+
+
+# 変換の種類 -> (入力ファイルの拡張子, 変換処理)
+CONVERTERS = {
+    "epub2pdf": (".epub", _convert_epub2pdf),
+    "pdf2images": (".pdf", _convert_pdf2images),
+    "html2images": (".html", _convert_html2images),
+}
+
+
+def run_job(kind: str, data: bytes, params: dict, time_limit: float | None) -> tuple[str, str, bytes]:
+    """
+    （ワーカープロセス）変換処理を実行する。
+
+    Returns:
+        tuple[str, str, bytes]: (Content-Type, ファイル名, 変換結果)。
+
+    Raises:
+        ConverterError: 変換に失敗した場合、または処理時間・メモリの上限を超えた場合。
+    """
+    suffix, converter = CONVERTERS[kind]
+    use_alarm = bool(time_limit) and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_time_limit)
+        signal.setitimer(signal.ITIMER_REAL, time_limit)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_path = Path(temp_dir) / f"input{suffix}"
+            input_path.write_bytes(data)
+            del data
+            try:
+                return converter(input_path, params)
+            except ConverterError as e:
+                # 作業用ディレクトリのパスをクライアントに返さないよう、アップロードの種類に置き換える
+                message = str(e).replace(str(input_path), f"アップロードされたファイル（{kind}）")
+                raise type(e)(message.replace(temp_dir, kind)) from e
+    except _TimeLimitExceeded as e:
+        raise JobLimitError("処理時間の上限を超えました。") from e
+    except MemoryError as e:
+        raise JobLimitError("メモリの上限を超えました。") from e
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+# --- サーバー側の処理 ---
+
+class HttpError(Exception):
+    """
+    HTTPのエラーレスポンスとして返す例外。
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class WorkerSlot:
+    """
+    1つのワーカープロセスを持つ実行枠。ジョブは空いている枠を占有して実行する。
+
+    枠ごとにプロセスプールを分けることで、時間切れや異常終了の際に該当するジョブのプロセスのみを作り直す。
+    """
+
+    def __init__(self, memory_limit_mb: int | None):
+        self.memory_limit_mb = memory_limit_mb
+        self.executor = None
+        self.pid = None
+
+    async def start(self):
+        """
+        ワーカープロセスを起動し、変換用ライブラリを読み込んだ状態で待機させる。
+        """
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                            initargs=(self.memory_limit_mb,))
+        loop = asyncio.get_running_loop()
+        self.pid = await loop.run_in_executor(self.executor, _warm_up)
+
+    def stop(self):
+        """
+        ワーカープロセスを強制終了し、プールを破棄する。
+        """
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            except OSError:
+                pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def restart(self):
+        """
+        処理中のワーカープロセスを強制終了し、新しいプロセスに置き換える。
+        """
+        self.stop()
+        await self.start()
+
+
+def error_status(error: Exception) -> int:
+    """
+    変換処理の例外に対応するHTTPステータスを返す。
+    """
+    if isinstance(error, (InputNotFoundError, InvalidInputError, NoImagesFoundError)):
+        return 422
+    if isinstance(error, JobLimitError):
+        return 504
+    return 500
+
+
+def parse_params(kind: str, query: dict) -> dict:
+    """
+    クエリ文字列から変換処理のパラメータを取得する。
+    """
+    def flag(name):
+        return query.get(name, ["0"])[-1].lower() in ("1", "true", "yes")
+
+    params = {}
+    try:
+        if "pages" in query:
+            params["pages"] = parse_page_spec(query["pages"][-1])
+        if kind == "epub2pdf":
+            params["dpi"] = int(query.get("dpi", ["72"])[-1])
+            params["skip_cover"] = flag("skip_cover")
+            params["linearize"] = flag("linearize")
+            params["dedup"] = flag("dedup")
+    except ValueError as e:
+        raise HttpError(400, f"パラメータが不正です: {e}") from e
+    return params
+
+
+class ConvertServer:
+    """
+    変換ジョブの受付・実行・結果の保持を行うHTTPサーバー。
+    """
+
+    def __init__(self, max_jobs: int = 2, max_queue: int = 16, time_limit: float | None = 300,
+                 memory_limit_mb: int | None = None, max_upload_mb: int = 512):
+        self.max_jobs = max_jobs
+        self.max_queue = max_queue
+        self.time_limit = time_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.max_upload_size = max_upload_mb * 1024 * 1024
+        self.slots = []
+        self.idle_slots = None
+        self.jobs = {}
+        self.queued = 0
+        self.running = 0
+        self.started_at = time.monotonic()
+        self.metrics = {
+            "jobs_succeeded": 0, "jobs_failed": 0, "jobs_rejected": 0,
+            "bytes_in": 0, "bytes_out": 0, "job_seconds": 0.0,
+        }
+
+    async def start_pool(self):
+        """
+        同時実行数と同じ数の実行枠を用意し、ワーカープロセスを起動する。
+        """
+        self.slots = [WorkerSlot(self.memory_limit_mb) for _ in range(self.max_jobs)]
+        await asyncio.gather(*(slot.start() for slot in self.slots))
+        self.idle_slots = asyncio.Queue()
+        for slot in self.slots:
+            self.idle_slots.put_nowait(slot)
+
+    def stop_pool(self):
+        """
+        すべてのワーカープロセスを終了する。
+        """
+        for slot in self.slots:
+            slot.stop()
+
+    async def run_conversion(self, kind: str, data: bytes, params: dict,
+                             job: dict | None = None) -> tuple[str, str, bytes]:
+        """
+        同時実行数の上限内で変換ジョブを実行する。
+
+        job を指定した場合は、実行枠を確保した時点でジョブの状態を running にする。
+        """
+        self.queued += 1
+        try:
+            slot = await self.idle_slots.get()
+        finally:
+            self.queued -= 1
+
+        if job is not None:
+            job["status"] = "running"
+        self.running += 1
+        started = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(slot.executor, run_job, kind, data, params, self.time_limit)
+            # ワーカー側で時間切れにできない環境向けに、サーバー側でも待ち時間を制限する
+            timeout = self.time_limit + 5 if self.time_limit else None
+            try:
+                result = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError as e:
+                # ワーカープロセスは処理を続けているため、強制終了して枠を作り直してから解放する
+                logger.warning("処理時間の上限を超えたため、ワーカープロセスを再起動します。")
+                await slot.restart()
+                raise JobLimitError("処理時間の上限を超えました。") from e
+            except BrokenProcessPool as e:
+                logger.warning("ワーカープロセスが異常終了したため、再起動します。")
+                await slot.restart()
+                raise JobLimitError("ワーカープロセスが異常終了しました（メモリ上限超過の可能性があります）。") from e
+            self.metrics["jobs_succeeded"] += 1
+            self.metrics["bytes_out"] += len(result[2])
+            return result
+        except Exception:
+            self.metrics["jobs_failed"] += 1
+            raise
+        finally:
+            self.metrics["job_seconds"] += time.monotonic() - started
+            self.running -= 1
+            self.idle_slots.put_nowait(slot)
+
+    async def run_async_job(self, job_id: str, kind: str, data: bytes, params: dict):
+        """
+        非同期ジョブを実行し、結果をジョブ一覧に保存する。
+        """
+        job = self.jobs[job_id]
+        job["status"] = "queued"
+        try:
+            job["result"] = await self.run_conversion(kind, data, params, job)
+            job["status"] = "done"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            job["error_status"] = error_status(e)
+            logger.error(f"ジョブ {job_id} が失敗しました: {e}")
+        job["finished_at"] = time.monotonic()
+
+    def purge_jobs(self):
+        """
+        保持期間を過ぎたジョブを削除する。
+        """
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.get("finished_at") and now - job["finished_at"] > JOB_RESULT_TTL]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def render_metrics(self) -> bytes:
+        """
+        メトリクスを Prometheus のテキスト形式で返す。
+        """
+        uptime = time.monotonic() - self.started_at
+        completed = self.metrics["jobs_succeeded"] + self.metrics["jobs_failed"]
+        lines = [
+            f"converter_uptime_seconds {uptime:.3f}",
+            f"converter_jobs_total{{status=\"succeeded\"}} {self.metrics['jobs_succeeded']}",
+            f"converter_jobs_total{{status=\"failed\"}} {self.metrics['jobs_failed']}",
+            f"converter_jobs_total{{status=\"rejected\"}} {self.metrics['jobs_rejected']}",
+            f"converter_jobs_running {self.running}",
+            f"converter_jobs_queued {self.queued}",
+            f"converter_max_concurrent_jobs {self.max_jobs}",
+            f"converter_job_seconds_total {self.metrics['job_seconds']:.3f}",
+            f"converter_bytes_in_total {self.metrics['bytes_in']}",
+            f"converter_bytes_out_total {self.metrics['bytes_out']}",
+            f"converter_jobs_per_second {completed / uptime if uptime else 0:.6f}",
+        ]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    async def handle_convert(self, kind: str, query: dict, body: bytes):
+        """
+        変換リクエストを処理する。
+        """
+        params = parse_params(kind, query)
+        if self.queued >= self.max_queue:
+            self.metrics["jobs_rejected"] += 1
+            raise HttpError(503, "待機中のジョブが上限に達しています。")
+        self.metrics["bytes_in"] += len(body)
+
+        if query.get("async", ["0"])[-1].lower() in ("1", "true", "yes"):
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {"status": "queued", "kind": kind}
+            self.jobs[job_id]["task"] = asyncio.create_task(self.run_async_job(job_id, kind, body, params))
+            return 202, "application/json", json_body({"job_id": job_id, "status": "queued"}), {}
+
+        try:
+            content_type, filename, data = await self.run_conversion(kind, body, params)
+        except ConverterError as e:
+            raise HttpError(error_status(e), str(e)) from e
+        return 200, content_type, data, {"Content-Disposition": f"attachment; filename=\"{filename}\""}
+
+    def handle_job(self, job_id: str, want_result: bool):
+        """
+        ジョブの状態または結果を返す。
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HttpError(404, "ジョブが見つかりません。")
+
+        if not want_result:
+            status = {"job_id": job_id, "kind": job["kind"], "status": job["status"]}
+            if "error" in job:
+                status["error"] = job["error"]
+            return 200, "application/json", json_body(status), {}
+
+        if job["status"] == "failed":
+            raise HttpError(job["error_status"], job["error"])
+        if job["status"] != "done":
+            raise HttpError(409, "ジョブはまだ完了していません。")
+        # 結果は取得後に破棄する
+        content_type, filename, data = job.pop("result")
+        del self.jobs[job_id]
+        return 200, content_type, data, {"Content-Disposition": f"attachment; filename=\"{filename}\""}
+
+    async def route(self, method: str, target: str, body: bytes):
+        """
+        リクエストを各処理に振り分ける。
+        """
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts == ["metrics"] and method == "GET":
+            return 200, "text/plain; version=0.0.4", self.render_metrics(), {}
+        if len(parts) == 2 and parts[0] == "convert" and parts[1] in CONVERTERS:
+            if method != "POST":
+                raise HttpError(405, "POST で送信してください。")
+            return await self.handle_convert(parts[1], query, body)
+        if len(parts) in (2, 3) and parts[0] == "jobs" and method == "GET":
+            want_result = len(parts) == 3
+            if want_result and parts[2] != "result":
+                raise HttpError(404, "見つかりません。")
+            return self.handle_job(parts[1], want_result)
+        raise HttpError(404, "見つかりません。")
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        1接続につき1リクエストを処理する。
+        """
+        try:
+            try:
+                header_data = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.LimitOverrunError:
+                await send_response(writer, 400, "application/json", error_body("ヘッダーが大きすぎます。"))
+                return
+            except asyncio.IncompleteReadError:
+                return
+
+            method = target = "-"
+            try:
+                # リクエスト行が不正な場合も 400 を返す
+                request_line, *header_lines = header_data.decode("latin-1").split("\r\n")
+                method, target, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                content_length = int(headers.get("content-length", "0"))
+                if content_length > self.max_upload_size:
+                    raise HttpError(413, "アップロードサイズが上限を超えています。")
+                body = await reader.readexactly(content_length) if content_length else b""
+                self.purge_jobs()
+                status, content_type, data, extra_headers = await self.route(method.upper(), target, body)
+            except HttpError as e:
+                status, content_type, data, extra_headers = e.status, "application/json", error_body(str(e)), {}
+            except ValueError:
+                status, content_type, data, extra_headers = 400, "application/json", error_body("不正なリクエストです。"), {}
+
+            await send_response(writer, status, content_type, data, extra_headers)
+            logger.info(f"{method} {target} -> {status} ({len(data):,} バイト)")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"リクエストの処理中にエラーが発生しました: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        """
+        サーバーを起動して待ち受ける。
+        """
+        await self.start_pool()
+        server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_HEADER_SIZE)
+        logger.info(f"http://{host}:{port} で待ち受けています（同時実行数: {self.max_jobs}）。")
+
+        # SIGTERM（コンテナの停止など）でも待ち受けを終了し、ワーカープロセスを停止する
+        stopped = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+        except (NotImplementedError, AttributeError):
+            # Windows ではシグナルハンドラーを登録できない
+            pass
+        try:
+            async with server:
+                await stopped.wait()
+            logger.info("SIGTERM を受信したため、サーバーを停止します。")
+        finally:
+            self.stop_pool()
+
+
+def json_body(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def error_body(message: str) -> bytes:
+    return json_body({"error": message})
+
+
+async def send_response(writer: asyncio.StreamWriter, status: int, content_type: str, data: bytes,
+                        extra_headers: dict | None = None):
+    """
+    HTTPレスポンスを送信する。本文は一定サイズごとに書き出し、クライアントの受信に合わせて送信する。
+    """
+    headers = {
+        "Content-Type": content_type,
+        "Content-Length": str(len(data)),
+        "Connection": "close",
+        **(extra_headers or {}),
+    }
+    head = f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+    writer.write(head.encode("latin-1"))
+    view = memoryview(data)
+    for offset in range(0, len(view), STREAM_CHUNK_SIZE):
+        writer.write(view[offset:offset + STREAM_CHUNK_SIZE])
+        await writer.drain()
+    await writer.drain()
+
+
+def main():
+    """
+    コマンドライン引数を処理し、変換サーバーを起動する。
+    """
+    parser = argparse.ArgumentParser(
+        description="EPUB→PDF、PDF→画像、HTML→画像の変換をHTTPで提供するローカルサーバー",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="待ち受けるアドレス（初期値: 127.0.0.1）。")
+    parser.add_argument("--port", type=int, default=8080, help="待ち受けるポート（初期値: 8080）。")
+    parser.add_argument("--max-jobs", type=int, default=2, help="同時に実行する変換ジョブ数（初期値: 2）。")
+    parser.add_argument("--max-queue", type=int, default=16, help="待機できる変換ジョブ数（初期値: 16）。")
+    parser.add_argument("--time-limit", type=float, default=300, help="1ジョブあたりの処理時間の上限（秒、初期値: 300）。")
+    parser.add_argument("--memory-limit", type=int, default=None,
+                        help="ワーカープロセスあたりのメモリ上限（MB、Unixのみ）。初期値: 無制限")
+    parser.add_argument("--max-upload", type=int, default=512, help="アップロードサイズの上限（MB、初期値: 512）。")
+    args = parser.parse_args()
+
+    server = ConvertServer(max_jobs=args.max_jobs, max_queue=args.max_queue, time_limit=args.time_limit,
+                           memory_limit_mb=args.memory_limit, max_upload_mb=args.max_upload)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("サーバーを停止しました。")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+変換処理で送出する例外の定義
+
+ライブラリとして使用する関数は sys.exit を呼ばずにこれらの例外を送出する。
+コマンドラインから実行した場合は、各スクリプトの main でエラーログを出力して終了する。
+"""
+
+
+class ConverterError(Exception):
+    """
+    変換処理の例外の基底クラス。
+    """
+
+
+class InputNotFoundError(ConverterError):
+    """
+    入力ファイルまたは入力ディレクトリが見つからない。
+    """
+
+
+class InvalidInputError(ConverterError):
+    """
+    入力ファイルを開けない、または解析できない。
+    """
+
+
+class NoImagesFoundError(ConverterError):
+    """
+    入力から処理対象の画像が見つからない。
+    """
+
+
+class OutputError(ConverterError):
+    """
+    出力先への書き込みに失敗した。
+    """
+
+
+class JobLimitError(ConverterError):
+    """
+    ジョブが処理時間またはメモリの上限を超えた。
+    """
@@ -3,12 +3,20 @@ EPUBファイル（固定レイアウト）から画像を抽出してページ
 """
 import argparse
 import logging
+import posixpath
+import queue
+import threading
 import zipfile
+import zlib
 import xml.etree.ElementTree as ET
 import sys
 import shutil
 from pathlib import Path
 
+import thumbnails
+from converter_errors import ConverterError, InputNotFoundError, InvalidInputError, OutputError
+from page_range import parse_page_spec, resolve_pages
+
 # ログ設定
 logging.basicConfig(
     level=logging.INFO,
@@ -17,6 +25,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# パイプライン処理で展開済みの画像を保持する数（スレッド数に対する倍率）
+PIPELINE_QUEUE_FACTOR = 2
+
 # 名前空間定義
 NS = {
     "container": "urn:oasis:names:tc:opendocument:xmlns:container",
@@ -37,6 +48,11 @@ def parse_args():
         )
     parser.add_argument("-i", "--input-epub", required=True, type=Path, help="画像抽出の対象となるEPUBファイルのパス。")
     parser.add_argument("--skip-cover", action="store_true", help="表紙（1ページ目）をスキップする。")
+    parser.add_argument("--pages", type=parse_page_spec, default=None,
+                        help="処理するページ範囲 (例: 1-3,7,10-)。連番は全ページ処理時と同じ番号を使用する。")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="画像を展開するスレッド数。2以上を指定すると展開と書き込みを並行して行う（初期値: 1）。")
+    thumbnails.add_thumbnail_arguments(parser)
     return parser.parse_args()
 
 
@@ -56,123 +72,299 @@ def get_opf_path(zip_ref):
         raise
 
 
-def extract_images(epub_path, output_dir, skip_cover=False):
+def resolve_image_paths(z, skip_cover=False, pages=None):
     """
-    EPUBから画像を抽出し、指定ディレクトリに保存する。
+    スパインを解析し、各ページの連番とZIP内の画像パスの対応を取得する。
+
+    pages（parse_page_spec の戻り値）が指定された場合は、該当するページの画像のみを返す。
+    連番を全ページ処理時と同じにするため、対象より前のページもXHTMLのみ解析して画像の有無を数える（画像は読み込まない）。
+
+    Returns:
+        list[tuple[int, str]]: (連番, ZIP内の画像パス) のリスト（ページ順）。
     """
-    logging.info(f"出力ディレクトリを確認・作成します: {output_dir}")
-    output_dir.mkdir(parents=True, exist_ok=True)
+    # OPFパス取得
+    opf_path_str = get_opf_path(z)
+    logger.info(f"OPFファイル: {opf_path_str}")
+
+    # OPF読み込み
+    opf_content = z.read(opf_path_str)
+    opf_root = ET.fromstring(opf_content)
+
+    # マニフェスト取得 (ID -> HREF)
+    manifest = {}
+    for item in opf_root.findall(".//opf:manifest/opf:item", NS):
+        manifest[item.attrib["id"]] = item.attrib["href"]
+
+    # スパイン取得 (表示順)
+    spine_items = []
+    for itemref in opf_root.findall(".//opf:spine/opf:itemref", NS):
+        spine_items.append(itemref.attrib["idref"])
+
+    logger.info(f"総ページ数（スキップ前）: {len(spine_items)}")
+
+    if skip_cover and len(spine_items) > 0:
+        logger.info("表紙（1ページ目）をスキップします。")
+        spine_items = spine_items[1:]
+
+    # ページ範囲指定時も、連番を数えるため最後の対象ページまでのスパイン項目を解析する
+    target_pages = set(resolve_pages(pages, len(spine_items)))
+    logger.info(f"処理対象ページ数: {len(target_pages)}")
+
+    # ZIP内のファイル一覧（画像の存在確認用）
+    zip_names = set(z.namelist())
+
+    # 各ページ(XHTML)から画像パスを取得
+    opf_dir = Path(opf_path_str).parent
+    count = 1
+    image_paths = []
+
+    for page_no in range(1, max(target_pages, default=0) + 1):
+        item_id = spine_items[page_no - 1]
+
+        if item_id not in manifest:
+            logger.warning(f"SpineのID '{item_id}' がManifestに見つかりません。スキップします。")
+            continue
+
+        xhtml_rel_path = manifest[item_id]
+        # OPFからの相対パスをZIP内の絶対パスに変換
+        xhtml_zip_path = (opf_dir / xhtml_rel_path).as_posix() # zip内はposixパス
+
+        try:
+            xhtml_content = z.read(xhtml_zip_path)
+            xhtml_root = ET.fromstring(xhtml_content)
+
+            # 画像パスを探す
+            # 1. <svg><image xlink:href="..."> パターン (Fixed Layoutで一般的)
+            # 2. <img src="..."> パターン
+            
+            image_href = None
+            
+            # SVG image探索
+            svg_image = xhtml_root.find(".//svg:image", NS)
+            if svg_image is not None:
+                # xlink:href または href (SVG2)
+                image_href = svg_image.get(f"{{{NS['xlink']}}}href")
+                if not image_href:
+                    image_href = svg_image.get("href")
+            
+            # imgタグ探索 (SVGが見つからない場合)
+            if not image_href:
+                img_tag = xhtml_root.find(".//xhtml:img", NS)
+                if img_tag is not None:
+                    image_href = img_tag.get("src")
+
+            if image_href:
+                # 画像パスの解決 (XHTMLからの相対パス -> ZIP内のパス)
+                xhtml_dir_posix = posixpath.dirname(xhtml_zip_path)
+                image_zip_path = posixpath.normpath(posixpath.join(xhtml_dir_posix, image_href))
+
+                if image_zip_path in zip_names:
+                    if page_no in target_pages:
+                        image_paths.append((count, image_zip_path))
+                    count += 1
+                else:
+                    logger.warning(f"画像ファイルがZIP内に見つかりません: {image_zip_path}")
+
+            else:
+                logger.warning(f"画像リンクが {xhtml_zip_path} 内に見つかりませんでした。")
+
+        except KeyError:
+            logger.warning(f"XHTMLファイルがZIP内に見つかりません: {xhtml_zip_path}")
+        except ET.ParseError as e:
+            logger.warning(f"XML解析エラー ({xhtml_zip_path}): {e}")
+
+    return image_paths
+
+
+def output_filename(count, image_zip_path):
+    """
+    出力ファイル名を生成する。
+
+    要件: "ファイル名は取得した画像ファイル名の前に、ゼロ埋めした数字4桁連番+"_"を付与する。"
+    """
+    return f"{count:04d}_{Path(image_zip_path).name}"
+
+
+def open_epub(epub_path):
+    """
+    EPUBファイルをZIPとして開く。
+
+    Raises:
+        InputNotFoundError: EPUBファイルが見つからない場合。
+        InvalidInputError: EPUBファイルを開けない場合。
+    """
+    epub_path = Path(epub_path)
+    if not epub_path.is_file():
+        raise InputNotFoundError(f"EPUBファイルが見つかりません: {epub_path}")
+
+    try:
+        return zipfile.ZipFile(epub_path, "r")
+    except zipfile.BadZipFile as e:
+        raise InvalidInputError(f"EPUBファイルを開けませんでした: {epub_path} - {e}") from e
+
 
+def resolve_epub(z, skip_cover=False, pages=None):
+    """
+    resolve_image_paths を実行し、解析エラーを InvalidInputError に変換する。
+    """
+    try:
+        return resolve_image_paths(z, skip_cover, pages)
+    except (KeyError, ValueError, ET.ParseError) as e:
+        raise InvalidInputError(f"EPUBの構造を解析できませんでした: {z.filename} - {e}") from e
+
+
+def iter_images(epub_path, skip_cover=False, pages=None):
+    """
+    EPUBから画像をページ順に読み込み、(連番, 出力ファイル名, 画像データ) を返すジェネレーター。
+
+    画像は1枚ずつ読み込むため、利用側の処理が進むまで次の画像は展開されない。
+
+    Raises:
+        InputNotFoundError: EPUBファイルが見つからない場合。
+        InvalidInputError: EPUBファイルを開けない、構造を解析できない、または画像を展開できない場合。
+    """
+    with open_epub(epub_path) as z:
+        for count, image_zip_path in resolve_epub(z, skip_cover, pages):
+            try:
+                image_data = z.read(image_zip_path)
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                raise InvalidInputError(f"画像の展開に失敗しました: {image_zip_path} - {e}") from e
+            yield count, output_filename(count, image_zip_path), image_data
+
+
+def _read_members(epub_path, tasks, results, stop):
+    """
+    （読み込みスレッド）タスクキューから画像を取り出して展開し、結果キューに渡す。
+
+    ZIPのハンドルはスレッドごとに開く。zlib の展開中はGILが解放されるため、複数スレッドで並列に展開される。
+    終了時には必ず None を結果キューに渡す。
+    """
     try:
         with zipfile.ZipFile(epub_path, "r") as z:
-            # OPFパス取得
-            opf_path_str = get_opf_path(z)
-            logger.info(f"OPFファイル: {opf_path_str}")
+            while not stop.is_set():
+                try:
+                    count, image_zip_path = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                results.put((count, output_filename(count, image_zip_path), z.read(image_zip_path)))
+    except Exception as e:
+        results.put(e)
+    finally:
+        results.put(None)
 
-            # OPF読み込み
-            opf_content = z.read(opf_path_str)
-            opf_root = ET.fromstring(opf_content)
 
-            # マニフェスト取得 (ID -> HREF)
-            manifest = {}
-            for item in opf_root.findall(".//opf:manifest/opf:item", NS):
-                manifest[item.attrib["id"]] = item.attrib["href"]
+def _extract_images_pipelined(epub_path, output_dir, image_paths, workers):
+    """
+    画像の展開を複数スレッドで行い、書き込みを呼び出し元のスレッドで行う。
 
-            # スパイン取得 (表示順)
-            spine_items = []
-            for itemref in opf_root.findall(".//opf:spine/opf:itemref", NS):
-                spine_items.append(itemref.attrib["idref"])
+    展開済みの画像は上限付きのキューで受け渡すため、書き込みが遅い場合は展開が待機する。
 
-            logger.info(f"総ページ数（スキップ前）: {len(spine_items)}")
+    Returns:
+        list[Path]: 保存した画像ファイルのパス。
+    """
+    tasks = queue.Queue()
+    for task in image_paths:
+        tasks.put(task)
+    results = queue.Queue(maxsize=workers * PIPELINE_QUEUE_FACTOR)
+    stop = threading.Event()
 
-            if skip_cover and len(spine_items) > 0:
-                logger.info("表紙（1ページ目）をスキップします。")
-                spine_items = spine_items[1:]
+    readers = [threading.Thread(target=_read_members, args=(epub_path, tasks, results, stop), daemon=True)
+               for _ in range(min(workers, len(image_paths)))]
+    for reader in readers:
+        reader.start()
 
-            logger.info(f"処理対象ページ数: {len(spine_items)}")
+    saved_paths = []
+    finished = 0
+    error = None
+    while finished < len(readers):
+        item = results.get()
+        if item is None:
+            finished += 1
+            continue
+        if error is not None:
+            # エラー発生後は読み込みスレッドの終了を待つためにキューを空にする
+            continue
+        if isinstance(item, Exception):
+            error = InvalidInputError(f"画像の展開に失敗しました: {item}")
+            stop.set()
+            continue
 
-            # 各ページ(XHTML)から画像を抽出
-            opf_dir = Path(opf_path_str).parent
-            count = 1
+        count, filename, image_data = item
+        output_path = output_dir / filename
+        try:
+            with open(output_path, "wb") as f:
+                f.write(image_data)
+        except OSError as e:
+            error = OutputError(f"画像の保存に失敗しました: {e}")
+            stop.set()
+            continue
+        logger.info(f"保存: {output_path}")
+        saved_paths.append(output_path)
 
-            for item_id in spine_items:
-                if item_id not in manifest:
-                    logger.warning(f"SpineのID '{item_id}' がManifestに見つかりません。スキップします。")
-                    continue
+    for reader in readers:
+        reader.join()
+    if error is not None:
+        raise error
+    return saved_paths
 
-                xhtml_rel_path = manifest[item_id]
-                # OPFからの相対パスをZIP内の絶対パスに変換
-                xhtml_zip_path = (opf_dir / xhtml_rel_path).as_posix() # zip内はposixパス
 
-                try:
-                    xhtml_content = z.read(xhtml_zip_path)
-                    xhtml_root = ET.fromstring(xhtml_content)
-
-                    # 画像パスを探す
-                    # 1. <svg><image xlink:href="..."> パターン (Fixed Layoutで一般的)
-                    # 2. <img src="..."> パターン
-                    
-                    image_href = None
-                    
-                    # SVG image探索
-                    svg_image = xhtml_root.find(".//svg:image", NS)
-                    if svg_image is not None:
-                        # xlink:href または href (SVG2)
-                        image_href = svg_image.get(f"{{{NS['xlink']}}}href")
-                        if not image_href:
-                            image_href = svg_image.get("href")
-                    
-                    # imgタグ探索 (SVGが見つからない場合)
-                    if not image_href:
-                        img_tag = xhtml_root.find(".//xhtml:img", NS)
-                        if img_tag is not None:
-                            image_href = img_tag.get("src")
-
-                    if image_href:
-                        # 画像パスの解決 (XHTMLからの相対パス -> ZIP内のパス)
-                        xhtml_dir = Path(xhtml_zip_path).parent
-                        
-                        import posixpath
-                        xhtml_dir_posix = posixpath.dirname(xhtml_zip_path)
-                        image_zip_path = posixpath.normpath(posixpath.join(xhtml_dir_posix, image_href))
-
-                        # 画像読み込み
-                        try:
-                            image_data = z.read(image_zip_path)
-                            
-                            # 出力ファイル名生成
-                            # 要件: "ファイル名は取得した画像ファイル名の前に、ゼロ埋めした数字4桁連番+"_"を付与する。"
-                            output_filename = f"{count:04d}_{Path(image_zip_path).name}" 
-                            
-                            output_path = output_dir / output_filename
-                            
-                            with open(output_path, "wb") as f:
-                                f.write(image_data)
-                            
-                            logger.info(f"保存: {output_path}")
-                            count += 1
-                            
-                        except KeyError:
-                             logger.warning(f"画像ファイルがZIP内に見つかりません: {image_zip_path}")
-
-                    else:
-                        logger.warning(f"画像リンクが {xhtml_zip_path} 内に見つかりませんでした。")
-
-                except KeyError:
-                    logger.warning(f"XHTMLファイルがZIP内に見つかりません: {xhtml_zip_path}")
-                except ET.ParseError as e:
-                    logger.warning(f"XML解析エラー ({xhtml_zip_path}): {e}")
+def extract_images(epub_path, output_dir, skip_cover=False, pages=None, workers=1):
+    """
+    EPUBから画像を抽出し、指定ディレクトリに保存する。
 
-    except Exception as e:
-        logger.error(f"エラーが発生しました: {e}")
-        sys.exit(1)
+    pages（parse_page_spec の戻り値）が指定された場合は、該当するページの画像のみを読み込む。
+    連番は全ページ処理時と同じ番号とする。
+    workers が2以上の場合は、スパインの解析後に画像の展開を複数スレッドで行い、書き込みと並行させる。
+
+    Returns:
+        list[Path]: 保存した画像ファイルのパス（ページ順）。
+
+    Raises:
+        ConverterError: 入力の読み込みまたは出力の書き込みに失敗した場合。
+    """
+    logging.info(f"出力ディレクトリを確認・作成します: {output_dir}")
+    try:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        raise OutputError(f"出力ディレクトリを作成できませんでした: {e}") from e
+
+    if workers > 1:
+        # 連番はスパインの解析時に確定させるため、展開の順序によらず同じファイル名になる
+        with open_epub(epub_path) as z:
+            image_paths = resolve_epub(z, skip_cover, pages)
+        logger.info(f"{workers} スレッドで画像を展開します。")
+        return _extract_images_pipelined(epub_path, output_dir, image_paths, workers)
+
+    saved_paths = []
+    try:
+        for count, filename, image_data in iter_images(epub_path, skip_cover, pages):
+            output_path = output_dir / filename
+            
+            with open(output_path, "wb") as f:
+                f.write(image_data)
+            
+            logger.info(f"保存: {output_path}")
+            saved_paths.append(output_path)
+
+    except OSError as e:
+        raise OutputError(f"画像の保存に失敗しました: {e}") from e
+
+    return saved_paths
 
 
 def main():
     args = parse_args()
     # 入力EPUBファイルのあるディレクトリに、EPUBのファイル名（拡張子なし）のディレクトリを作成する
     output_dir = args.input_epub.parent / args.input_epub.stem
-    extract_images(args.input_epub, output_dir, args.skip_cover)
+    try:
+        saved_paths = extract_images(args.input_epub, output_dir, args.skip_cover, args.pages, args.workers)
+        if args.thumbnails:
+            # 今回保存した画像のみを対象とし、以前の実行で保存した画像のサムネイルは作り直さない
+            thumbnails.create_thumbnails(output_dir, output_dir / "thumbnails", size=args.thumbnail_size,
+                                         sprite=args.thumbnail_sprite, files=saved_paths)
+    except ConverterError as e:
+        logger.error(f"エラーが発生しました: {e}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+"""
+実質的にグレースケールのカラー画像を検出し、8ビットグレースケールで再エンコードする共通モジュール
+
+dependencies:
+    uv add pillow
+"""
+import csv
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image, ImageChops
+
+logger = logging.getLogger(__name__)
+
+# 判定用に縮小する長辺のピクセル数
+ANALYSIS_SIZE = 256
+
+# 色差（Cb/Cr の 128 からの偏差）がこの値以下の画素を無彩色とみなす
+DEFAULT_TOLERANCE = 8
+
+# 有彩色の画素の割合がこの値以下の画像をグレースケールと判定する
+DEFAULT_MAX_COLOR_RATIO = 0.001
+
+# 量子化テーブルを取得できないJPEGを再エンコードする際の品質
+DEFAULT_QUALITY = 90
+
+# 再エンコード後のサイズがこの割合以上小さくならない場合は元の画像を使用する
+DEFAULT_MIN_SAVING = 0.05
+
+# 色差の絶対偏差を求めるルックアップテーブル
+_CHROMA_DEVIATION_LUT = [abs(v - 128) for v in range(256)]
+
+# 再エンコードに対応する形式
+_SUPPORTED_FORMATS = ("JPEG", "PNG")
+
+
+def open_source(source):
+    """
+    画像データまたはファイルパスから画像を開く。
+    """
+    if isinstance(source, (str, Path)):
+        return Image.open(source)
+    return Image.open(io.BytesIO(source))
+
+
+def save_options(img: Image.Image, quality: int = DEFAULT_QUALITY) -> dict:
+    """
+    再エンコード時の Pillow の保存オプションを返す。
+
+    JPEGは元画像の輝度の量子化テーブルを再利用し、画質の劣化とサイズの増加を抑える。
+    量子化テーブルを取得できない場合は quality で保存する。
+    """
+    if img.format == "PNG":
+        return {"format": "PNG", "optimize": True}
+    quantization = getattr(img, "quantization", None)
+    if quantization:
+        return {"format": "JPEG", "qtables": [quantization[0]], "optimize": True}
+    return {"format": "JPEG", "quality": quality, "optimize": True}
+
+
+def downsample(img: Image.Image) -> Image.Image:
+    """
+    判定用に画像を縮小してRGBでデコードする。
+
+    JPEGはDCT領域で縮小してデコードするため、フル解像度の展開を行わない。
+
+    Args:
+        img (Image.Image): 開いた直後の画像。
+
+    Returns:
+        Image.Image: 長辺が ANALYSIS_SIZE 以下のRGB画像。
+    """
+    img.draft("RGB", (ANALYSIS_SIZE, ANALYSIS_SIZE))
+    small = img.convert("RGB")
+    small.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+    return small
+
+
+def color_ratio(small: Image.Image, tolerance: int = DEFAULT_TOLERANCE) -> float:
+    """
+    縮小した画像の色差チャンネルから、有彩色の画素の割合を求める。
+
+    Cb/Cr チャンネルの偏差はルックアップテーブルとヒストグラムで一括計算し、画素ごとのループは行わない。
+
+    Args:
+        small (Image.Image): downsample で縮小したRGB画像。
+        tolerance (int): 無彩色とみなす色差の上限。
+
+    Returns:
+        float: 有彩色の画素の割合（0.0〜1.0）。
+    """
+    _, cb, cr = small.convert("YCbCr").split()
+    deviation = ImageChops.lighter(cb.point(_CHROMA_DEVIATION_LUT), cr.point(_CHROMA_DEVIATION_LUT))
+    histogram = deviation.histogram()
+    colored = sum(histogram[tolerance + 1:])
+    return colored / (small.width * small.height)
+
+
+def convert_image(source, name: str, tolerance: int = DEFAULT_TOLERANCE,
+                  max_color_ratio: float = DEFAULT_MAX_COLOR_RATIO,
+                  quality: int = DEFAULT_QUALITY,
+                  min_saving: float = DEFAULT_MIN_SAVING) -> tuple[bytes | None, dict]:
+    """
+    画像がグレースケールかを判定し、該当する場合は8ビットグレースケールで再エンコードする。
+
+    再エンコード後のサイズが元より min_saving の割合以上小さくならない場合は採用しない。
+
+    Args:
+        source (bytes | Path): 画像データまたは画像ファイルのパス。
+        name (str): レポートに記載する名前。
+        tolerance (int): 無彩色とみなす色差の上限。
+        max_color_ratio (float): グレースケールと判定する有彩色の画素の割合の上限。
+        quality (int): 量子化テーブルを取得できないJPEGを再エンコードする際の品質。
+        min_saving (float): 再エンコード結果を採用するサイズの削減率の下限。
+
+    Returns:
+        tuple[bytes | None, dict]: (再エンコードした画像データ、変換しない場合は None, レポート)。
+    """
+    original_size = source.stat().st_size if isinstance(source, Path) else len(source)
+    report = {"name": name, "decision": "", "color_ratio": "", "original_size": original_size,
+              "new_size": original_size}
+
+    with open_source(source) as img:
+        if img.mode in ("1", "L", "LA", "I", "I;16", "F"):
+            report["decision"] = "already_gray"
+            return None, report
+        if img.format not in _SUPPORTED_FORMATS:
+            report["decision"] = "unsupported"
+            return None, report
+
+        ratio = color_ratio(downsample(img), tolerance)
+        report["color_ratio"] = f"{ratio:.6f}"
+        if ratio > max_color_ratio:
+            report["decision"] = "color"
+            return None, report
+
+    # 判定用に縮小デコードしたため、再エンコードは開き直してフル解像度で行う
+    with open_source(source) as img:
+        gray = img.convert("L")
+        buffer = io.BytesIO()
+        options = save_options(img, quality)
+        # img2pdf は EXIF の Orientation でページを回転するため、EXIF を引き継ぐ
+        if "exif" in img.info:
+            options["exif"] = img.info["exif"]
+        gray.save(buffer, dpi=img.info.get("dpi", (72, 72)), **options)
+    data = buffer.getvalue()
+
+    if len(data) > original_size * (1 - min_saving):
+        report["decision"] = "gray_kept"
+        return None, report
+
+    report["decision"] = "converted"
+    report["new_size"] = len(data)
+    return data, report
+
+
+def _convert_task(task: tuple) -> tuple[bytes | None, dict]:
+    """
+    （ワーカープロセス）変換処理を実行する。失敗した画像は変換せずレポートに記録する。
+    """
+    converter, source, name, options = task
+    try:
+        return converter(source, name, **options)
+    except Exception as e:
+        logger.warning(f"画像の判定に失敗しました: {name} - {e}")
+        return None, {"name": name, "decision": "error"}
+
+
+def convert_images(items: list[tuple[str, bytes | Path]], workers: int | None = None, converter=None,
+                   label: str = "グレースケール", **options) -> tuple[list[bytes | None], list[dict]]:
+    """
+    複数の画像の判定と再エンコードをプロセスプールで行う。
+
+    Args:
+        items (list[tuple[str, bytes | Path]]): (名前, 画像データまたは画像ファイルのパス) のリスト。
+        workers (int | None): ワーカープロセス数。None の場合はCPU数。
+        converter: 1枚ごとの変換処理。None の場合は convert_image。
+        label (str): ログに出力する変換の名前。
+        **options: converter に渡すオプション。
+
+    Returns:
+        tuple[list[bytes | None], list[dict]]: 入力と同じ順序の、再エンコード結果とレポートのリスト。
+    """
+    if not items:
+        return [], []
+
+    converter = converter or convert_image
+    tasks = [(converter, source, name, options) for name, source in items]
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_convert_task, tasks, chunksize=chunk_size))
+
+    converted = [data for data, _ in results]
+    reports = [report for _, report in results]
+    log_summary(reports, label)
+    return converted, reports
+
+
+def log_summary(reports: list[dict], label: str = "グレースケール"):
+    """
+    ページごとの判定結果と、全体のサイズの変化をログに出力する。
+    """
+    before = after = converted = 0
+    for report in reports:
+        logger.info(f"  {report['name']}: {report['decision']}"
+                    f" ({report.get('original_size', '')} -> {report.get('new_size', '')} バイト)")
+        if report["decision"] == "converted":
+            converted += 1
+            before += report["original_size"]
+            after += report["new_size"]
+    logger.info(f"{converted} / {len(reports)} 枚を{label}に変換し、{before - after:,} バイト削減しました。")
+
+
+def write_report(reports: list[dict], report_path: Path):
+    """
+    ページごとの判定結果をCSVに出力する。
+    """
+    fieldnames = []
+    for report in reports:
+        fieldnames.extend(key for key in report if key not in fieldnames)
+    with report_path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(reports)
+    logger.info(f"判定結果のレポートを出力しました: {report_path}")
+
+
+def add_grayscale_arguments(parser):
+    """
+    グレースケール変換用のコマンドライン引数を追加する。
+    """
+    parser.add_argument("--grayscale", action="store_true",
+                        help="実質的にグレースケールのカラー画像を8ビットグレースケールで再エンコードする。")
+    parser.add_argument("--gray-tolerance", type=int, default=DEFAULT_TOLERANCE,
+                        help=f"無彩色とみなす色差の上限（0〜127、初期値: {DEFAULT_TOLERANCE}）。")
+    parser.add_argument("--gray-report", type=Path, default=None, help="グレースケール判定のレポート（CSV）の出力先。")
+    parser.add_argument("--workers", type=int, default=None, help="判定に使用するワーカープロセス数（初期値: CPU数）。")
@@ -9,6 +9,8 @@ import base64
 import urllib.request
 import sys
 
+from converter_errors import ConverterError, InputNotFoundError, InvalidInputError, OutputError
+
 # ログ設定
 logging.basicConfig(
     level=logging.INFO,
@@ -17,34 +19,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def extract_images(html_file_path: Path, output_dir: Path):
+def iter_images(html_file_path: Path):
     """
-    HTMLファイルから画像を抽出し、指定されたディレクトリに保存する。
+    HTMLファイルから画像を順に取り出し、(連番, 出力ファイル名, 画像データ) を返すジェネレーター。
+
+    取得に失敗した画像は返さないが、連番は消費する。
 
     Args:
         html_file_path (Path): 入力HTMLファイルのパス。
-        output_dir (Path): 画像を保存するディレクトリのパス。
-    """
-    logger.info("スクリプトを開始します。")
-    logger.info(f"HTMLファイルパス: {html_file_path}")
-    logger.info(f"出力ディレクトリ: {output_dir}")
-
-    # --- 出力ディレクトリの作成 ---
-    logging.info(f"出力ディレクトリを確認・作成します: {output_dir}")
-    output_dir.mkdir(parents=True, exist_ok=True)
 
+    Raises:
+        InputNotFoundError: HTMLファイルが見つからない場合。
+        InvalidInputError: HTMLファイルを読み込めない場合。
+    """
     # --- HTMLコンテンツの読み込み ---
     # ファイルが大きいため、一行ずつ読み込んで処理することも検討しましたが、
     # <div class="slide"> が複数行にまたがることを考えると、全体を読み込む必要があります。
     logging.info(f"{html_file_path} を読み込んでいます...")
     try:
         html_content = html_file_path.read_text(encoding='utf-8')
-    except FileNotFoundError:
-        logging.error(f"ファイルが見つかりません: {html_file_path}")
-        sys.exit(1)
-    except MemoryError:
-        logging.error("ファイルが大きすぎてメモリに読み込めません。")
-        sys.exit(1)
+    except FileNotFoundError as e:
+        raise InputNotFoundError(f"ファイルが見つかりません: {html_file_path}") from e
+    except MemoryError as e:
+        raise InvalidInputError("ファイルが大きすぎてメモリに読み込めません。") from e
+    except (OSError, UnicodeDecodeError) as e:
+        raise InvalidInputError(f"ファイルを読み込めませんでした: {html_file_path} - {e}") from e
 
     logging.info("読み込みが完了しました。画像ソースを検索します...")
 
@@ -66,18 +65,16 @@ def extract_images(html_file_path: Path, output_dir: Path):
         logging.warning("画像ソースが見つかりませんでした。HTMLの構造を確認してください。")
         logging.warning(f"試したスライドパターン: {slide_pattern}")
         logging.warning(f"試した画像パターン: {img_pattern}")
-        sys.exit(0)
+        return
 
-    logging.info(f"{len(image_srcs)} 件の画像ソースが見つかりました。ファイルを保存します...")
+    logging.info(f"{len(image_srcs)} 件の画像ソースが見つかりました。")
 
-    # --- 画像データの処理と保存 ---
+    # --- 画像データの処理 ---
     # 画像ファイル名の連番カウンター
     image_counter = 1
-    saved_count = 0
     for src in image_srcs:
         # 出力ファイル名を生成 (例: 0001.jpg)
         file_name = f"{image_counter:04d}.jpg"
-        output_path = output_dir / file_name
 
         try:
             image_data = None
@@ -102,11 +99,10 @@ def extract_images(html_file_path: Path, output_dir: Path):
                 logging.warning(f"スキップしました: サポートされていないsrc形式です - {src[:70]}...")
                 continue # 次のsrcへ
 
-            # データがあればファイルに書き込み
+            # データがあれば返す
             if image_data:
-                output_path.write_bytes(image_data)
-                logging.info(f"保存しました: {output_path} (ソース: {source_type})")
-                saved_count += 1
+                logging.info(f"取得しました: {file_name} (ソース: {source_type})")
+                yield image_counter, file_name, image_data
         
         except Exception as e:
             logging.error(f"エラー: {src[:70]}... の処理中にエラーが発生しました - {e}")
@@ -115,7 +111,43 @@ def extract_images(html_file_path: Path, output_dir: Path):
             # srcの形式に関わらずファイル名はインクリメントする
             image_counter += 1
 
-    logging.info(f"処理が完了しました。{saved_count} / {len(image_srcs)} 件の画像を保存しました。")
+
+def extract_images(html_file_path: Path, output_dir: Path) -> list[Path]:
+    """
+    HTMLファイルから画像を抽出し、指定されたディレクトリに保存する。
+
+    Args:
+        html_file_path (Path): 入力HTMLファイルのパス。
+        output_dir (Path): 画像を保存するディレクトリのパス。
+
+    Returns:
+        list[Path]: 保存した画像ファイルのパス。
+
+    Raises:
+        ConverterError: HTMLファイルを読み込めない場合、または画像を保存できない場合。
+    """
+    logger.info("スクリプトを開始します。")
+    logger.info(f"HTMLファイルパス: {html_file_path}")
+    logger.info(f"出力ディレクトリ: {output_dir}")
+
+    # --- 出力ディレクトリの作成 ---
+    logging.info(f"出力ディレクトリを確認・作成します: {output_dir}")
+    saved_paths = []
+    try:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        # --- 画像データの保存 ---
+        for image_counter, file_name, image_data in iter_images(html_file_path):
+            output_path = output_dir / file_name
+            output_path.write_bytes(image_data)
+            logging.info(f"保存しました: {output_path}")
+            saved_paths.append(output_path)
+
+    except OSError as e:
+        raise OutputError(f"画像の保存に失敗しました: {e}") from e
+
+    logging.info(f"処理が完了しました。{len(saved_paths)} 件の画像を保存しました。")
+    return saved_paths
 
 def main():
     """
@@ -131,7 +163,11 @@ def main():
 
     # 入力HTMLファイルのあるディレクトリに、HTMLのファイル名（拡張子なし）のディレクトリを作成する
     output_dir = args.input_html.parent / args.input_html.stem
-    extract_images(args.input_html, output_dir)
+    try:
+        extract_images(args.input_html, output_dir)
+    except ConverterError as e:
+        logging.error(f"エラー: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -2,13 +2,22 @@
 画像ファイルからPDFファイルを作成するスクリプト
 
 dependencies:
-    uv add img2pdf
+    uv add img2pdf pikepdf
 """
+import hashlib
+import io
 import logging
 import argparse
 import sys
 from pathlib import Path
 import img2pdf
+import pikepdf
+
+import bilevel
+import grayscale
+from converter_errors import ConverterError, InputNotFoundError, InvalidInputError, NoImagesFoundError, OutputError
+from page_range import parse_page_spec, resolve_pages
+from pdf_linearize import save_linearized
 
 # ログ設定
 logging.basicConfig(
@@ -18,10 +27,217 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def create_pdf_from_images(image_folder: Path, output_pdf_path: Path, dpi: int = 72):
+# ハッシュ計算時の読み込みサイズ
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: Path) -> str:
+    """
+    ファイル内容のSHA-256ハッシュを返す。
+    """
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_duplicate_images(sources: list[bytes | Path]) -> list[int | None]:
+    """
+    バイト単位で同一の画像を検出し、各画像について最初に出現した同一画像のインデックスを返す。
+
+    サイズが他と重複する画像のみハッシュを計算する。
+
+    Args:
+        sources (list[bytes | Path]): 画像データまたは画像ファイルのパスのリスト（ページ順）。
+
+    Returns:
+        list[int | None]: 重複元のインデックス。最初の出現（または重複なし）の場合は None。
+    """
+    sizes = [source.stat().st_size if isinstance(source, Path) else len(source) for source in sources]
+    size_counts = {}
+    for size in sizes:
+        size_counts[size] = size_counts.get(size, 0) + 1
+
+    first_index = {}
+    duplicate_of = []
+    for index, (source, size) in enumerate(zip(sources, sizes)):
+        if size_counts[size] < 2:
+            duplicate_of.append(None)
+            continue
+        digest = hash_file(source) if isinstance(source, Path) else hashlib.sha256(source).hexdigest()
+        key = (size, digest)
+        duplicate_of.append(first_index.get(key))
+        first_index.setdefault(key, index)
+    return duplicate_of
+
+
+def deduplicate_image_xobjects(pdf: pikepdf.Pdf, duplicate_of: list[int | None]) -> int:
+    """
+    重複ページの画像XObjectを、最初に出現したページの画像XObjectへの参照に置き換える。
+
+    参照されなくなった画像ストリームは保存時に出力されない。
+
+    Args:
+        pdf (pikepdf.Pdf): img2pdf で作成したPDF（1画像1ページ）。
+        duplicate_of (list[int | None]): find_duplicate_images の戻り値。
+
+    Returns:
+        int: 削減された画像ストリームのバイト数。
+    """
+    saved_bytes = 0
+    for index, source_index in enumerate(duplicate_of):
+        if source_index is None:
+            continue
+        source_xobjects = pdf.pages[source_index].Resources.XObject
+        xobjects = pdf.pages[index].Resources.XObject
+        for name in list(xobjects.keys()):
+            if name not in source_xobjects or xobjects[name].get("/Subtype") != pikepdf.Name.Image:
+                continue
+            if xobjects[name].objgen == source_xobjects[name].objgen:
+                continue
+            saved_bytes += len(xobjects[name].read_raw_bytes())
+            xobjects[name] = source_xobjects[name]
+    return saved_bytes
+
+
+def build_pdf(images, output, dpi: int = 72, linearize: bool = False, dedup: bool = False,
+              to_grayscale: bool = False, gray_tolerance: int = grayscale.DEFAULT_TOLERANCE,
+              workers: int | None = None, gray_report_path: Path | None = None, to_bilevel: bool = False,
+              bilevel_ratio: float = bilevel.DEFAULT_MIN_BILEVEL_RATIO,
+              bilevel_report_path: Path | None = None) -> dict:
+    """
+    (連番, 名前, 画像データ) のイテラブルからPDFを作成する。
+
+    epub2img.iter_images や pdf2img.iter_images の戻り値をそのまま渡せる。
+    img2pdf はすべての画像を一括で変換するため、イテラブルはここで最後まで読み込まれる。
+
+    Args:
+        images: (連番, 名前, 画像データまたは画像ファイルのパス) のイテラブル（ページ順）。
+        output: 出力先のパス、またはバイナリ書き込み可能なストリーム。
+        dpi (int): PDFに使用するDPI。
+        linearize (bool): Web表示用に線形化して保存する場合は True。
+        dedup (bool): 同一画像を1つの画像オブジェクトにまとめる場合は True。
+        to_grayscale (bool): 実質的にグレースケールの画像を8ビットグレースケールで埋め込む場合は True。
+        gray_tolerance (int): グレースケール判定で無彩色とみなす色差の上限。
+        workers (int | None): グレースケール・2値判定のワーカープロセス数。None の場合はCPU数。
+        gray_report_path (Path | None): グレースケール判定のレポート（CSV）の出力先。
+        to_bilevel (bool): 白黒2値とみなせる画像を CCITT Group 4 で埋め込む場合は True。
+            グレースケール判定より先に行い、2値化した画像はグレースケール判定の対象外とする。
+        bilevel_ratio (float): 2値と判定する黒付近・白付近の画素の割合の下限。
+        bilevel_report_path (Path | None): 2値判定のレポート（CSV）の出力先。
+
+    Returns:
+        dict: 以下のキーを持つ辞書。
+            pages (int): ページ数。
+            duplicates (int): 共有した重複画像の枚数。
+            saved_bytes (int): 重複画像の共有により削減したバイト数。
+            linearization (dict | None): 線形化した場合は pdf_linearize.get_linearization_info の戻り値。
+            bilevel (list[dict]): 2値判定を行った場合のみ、ページごとのレポート。
+            grayscale (list[dict]): グレースケール判定を行った場合のみ、ページごとのレポート。
+
+    Raises:
+        NoImagesFoundError: 画像が1枚もない場合。
+        InvalidInputError: 画像をPDFに変換できない場合。
+        OutputError: PDFを保存できない場合。
+    """
+    images = list(images)
+    sources = [source for _, _, source in images]
+    if not sources:
+        raise NoImagesFoundError("PDFに変換する画像がありません。")
+
+    result = {"pages": len(sources), "duplicates": 0, "saved_bytes": 0, "linearization": None}
+
+    # 2値判定と Group 4 への変換（写真ページは元の画像のまま）
+    names = [name for _, name, _ in images]
+    pending = list(range(len(sources)))
+    if to_bilevel:
+        logger.info("白黒2値のページを判定しています...")
+        converted, reports = bilevel.convert_images([(names[i], sources[i]) for i in pending], workers=workers,
+                                                    min_bilevel_ratio=bilevel_ratio)
+        for index, data in zip(pending, converted):
+            if data is not None:
+                sources[index] = data
+        pending = [index for index, data in zip(pending, converted) if data is None]
+        result["bilevel"] = reports
+        if bilevel_report_path is not None:
+            grayscale.write_report(reports, bilevel_report_path)
+
+    # グレースケール判定と再エンコード
+    if to_grayscale:
+        logger.info("グレースケールの画像を判定しています...")
+        converted, reports = grayscale.convert_images([(names[i], sources[i]) for i in pending], workers=workers,
+                                                      tolerance=gray_tolerance)
+        for index, data in zip(pending, converted):
+            if data is not None:
+                sources[index] = data
+        result["grayscale"] = reports
+        if gray_report_path is not None:
+            grayscale.write_report(reports, gray_report_path)
+
+    # 同一画像の検出
+    duplicate_of = None
+    if dedup:
+        duplicate_of = find_duplicate_images(sources)
+        result["duplicates"] = sum(1 for source_index in duplicate_of if source_index is not None)
+        logger.info(f"{result['duplicates']} 枚の重複画像を検出しました。")
+        if result["duplicates"] == 0:
+            duplicate_of = None
+
+    # 画像をPDFに変換
+    logger.info(f"DPI={dpi} を使用して {len(sources)} 枚の画像をPDFに変換中...")
+    try:
+        # img2pdf.convert はファイル名のリスト（文字列）またはバイナリデータを想定
+        # layout_fun を使用して、画像の内部DPIを無視し、特定のDPIを強制する
+        layout_function = img2pdf.get_fixed_dpi_layout_fun((dpi, dpi))
+        pdf_bytes = img2pdf.convert([str(s) if isinstance(s, Path) else s for s in sources],
+                                    layout_fun=layout_function)
+    except Exception as e:
+        raise InvalidInputError(f"画像をPDFに変換できませんでした: {e}") from e
+
+    try:
+        if linearize or duplicate_of is not None:
+            with pikepdf.Pdf.open(io.BytesIO(pdf_bytes)) as pdf:
+                if duplicate_of is not None:
+                    # 重複画像を1つのXObjectにまとめる
+                    result["saved_bytes"] = deduplicate_image_xobjects(pdf, duplicate_of)
+                    logger.info(f"重複画像の共有により {result['saved_bytes']:,} バイト削減しました。")
+                if linearize:
+                    # Web表示用に線形化し、オブジェクトストリームで圧縮して保存する
+                    result["linearization"] = save_linearized(pdf, output)
+                else:
+                    pdf.save(output)
+        elif isinstance(output, (str, Path)):
+            with open(output, "wb") as f:
+                f.write(pdf_bytes)
+        else:
+            output.write(pdf_bytes)
+    except OSError as e:
+        raise OutputError(f"PDFを保存できませんでした: {e}") from e
+
+    return result
+
+
+def create_pdf_from_images(image_folder: Path, output_pdf_path: Path, dpi: int = 72,
+                           pages: list[tuple[int, int | None]] | None = None, **build_options) -> dict:
+    """
+    フォルダ内のJPEG画像からPDFを作成する。
+
+    Args:
+        image_folder (Path): 画像ファイルを含むディレクトリ。
+        output_pdf_path (Path): 出力するPDFのパス。
+        dpi (int): PDFに使用するDPI。
+        pages (list[tuple[int, int | None]] | None): PDFに含めるページ範囲（parse_page_spec の戻り値）。
+        **build_options: build_pdf に渡すオプション（linearize, dedup, to_grayscale など）。
+
+    Returns:
+        dict: build_pdf の戻り値。
+
+    Raises:
+        ConverterError: 入力ディレクトリや画像が見つからない場合、またはPDFを作成できない場合。
+    """
     if not image_folder.is_dir():
-        logger.error(f"入力ディレクトリが見つかりません: {image_folder}")
-        return
+        raise InputNotFoundError(f"入力ディレクトリが見つかりません: {image_folder}")
 
     # すべてのJPG/JPEGファイルを取得
     image_files = []
@@ -33,30 +249,23 @@ def create_pdf_from_images(image_folder: Path, output_pdf_path: Path, dpi: int =
     image_files.sort(key=lambda f: f.stem)
 
     if not image_files:
-        logger.warning(f"{image_folder} 内にJPEG画像が見つかりません")
-        return
+        raise NoImagesFoundError(f"{image_folder} 内にJPEG画像が見つかりません")
+
+    # ページ範囲が指定された場合は対象の画像のみに絞り込む
+    page_numbers = resolve_pages(pages, len(image_files))
+    if not page_numbers:
+        raise NoImagesFoundError(f"{image_folder} 内に指定されたページ範囲の画像がありません")
 
     # 出力ディレクトリが存在することを確認
     try:
         output_pdf_path.parent.mkdir(parents=True, exist_ok=True)
     except OSError as e:
-        logger.error(f"出力ディレクトリ {output_pdf_path.parent} の作成中にエラーが発生しました: {e}")
-        return
+        raise OutputError(f"出力ディレクトリ {output_pdf_path.parent} の作成中にエラーが発生しました: {e}") from e
 
-    # 画像をPDFに変換
-    logger.info(f"DPI={dpi} を使用して {len(image_files)} 枚の画像をPDFに変換中...")
-    try:
-        # img2pdf.convert はファイル名のリスト（文字列）またはバイナリデータを想定
-        # layout_fun を使用して、画像の内部DPIを無視し、特定のDPIを強制する
-        layout_function = img2pdf.get_fixed_dpi_layout_fun((dpi, dpi))
-        pdf_bytes = img2pdf.convert([str(p) for p in image_files], layout_fun=layout_function)
-        
-        with open(output_pdf_path, "wb") as f:
-            f.write(pdf_bytes)
-            
-        logger.info(f"PDFを正常に作成しました: {output_pdf_path}")
-    except Exception as e:
-        logger.error(f"PDF作成中にエラーが発生しました: {e}")
+    images = [(page_no, image_files[page_no - 1].name, image_files[page_no - 1]) for page_no in page_numbers]
+    result = build_pdf(images, output_pdf_path, dpi=dpi, **build_options)
+    logger.info(f"PDFを正常に作成しました: {output_pdf_path}")
+    return result
 
 
 def main():
@@ -66,6 +275,14 @@ def main():
     )
     parser.add_argument("-i", "--input-dir", type=Path, required=True, help="画像ファイルを含むディレクトリ。")
     parser.add_argument("--dpi", type=int, default=72, help="PDFに使用するDPI（デフォルト: 72）。")
+    parser.add_argument("--pages", type=parse_page_spec, default=None,
+                        help="PDFに含めるページ範囲 (例: 1-3,7,10-)。ソート後の画像の順番で指定する。")
+    parser.add_argument("--linearize", action="store_true",
+                        help="Web表示用に線形化し、オブジェクトストリームと圧縮xrefストリームで保存する。")
+    parser.add_argument("--dedup", action="store_true",
+                        help="バイト単位で同一の画像を1つの画像オブジェクトにまとめてPDFに埋め込む。")
+    grayscale.add_grayscale_arguments(parser)
+    bilevel.add_bilevel_arguments(parser)
     args = parser.parse_args()
 
     # 入力ディレクトリに基づいて出力パスを決定
@@ -76,7 +293,15 @@ def main():
     output_pdf_name = f"{input_dir.name}.pdf"
     output_pdf_path = output_dir / output_pdf_name
 
-    create_pdf_from_images(args.input_dir, output_pdf_path, dpi=args.dpi)
+    try:
+        create_pdf_from_images(args.input_dir, output_pdf_path, dpi=args.dpi, pages=args.pages,
+                               linearize=args.linearize, dedup=args.dedup, to_grayscale=args.grayscale,
+                               gray_tolerance=args.gray_tolerance, workers=args.workers,
+                               gray_report_path=args.gray_report, to_bilevel=args.bilevel,
+                               bilevel_ratio=args.bilevel_ratio, bilevel_report_path=args.bilevel_report)
+    except ConverterError as e:
+        logger.error(f"PDF作成中にエラーが発生しました: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
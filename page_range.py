@@ -0,0 +1,72 @@
+"""
+ページ範囲指定（--pages）を解析する共通モジュール
+
+指定例:
+    "5"         5ページのみ
+    "1-3,7"     1〜3ページと7ページ
+    "10-"       10ページから最後まで
+    "-5"        最初から5ページまで
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def parse_page_spec(spec: str) -> list[tuple[int, int | None]]:
+    """
+    ページ範囲指定文字列を (開始, 終了) のリストに変換する。
+
+    ページ番号は1始まりとし、終了が None の場合は最終ページまでを表す。
+    argparse の type としても使用できるよう、書式エラーは ValueError を送出する。
+
+    Args:
+        spec (str): ページ範囲指定文字列 (例: "1-3,7,10-")。
+
+    Returns:
+        list[tuple[int, int | None]]: (開始ページ, 終了ページ) のリスト。
+    """
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start_str, end_str = part.split("-", 1)
+            start = int(start_str) if start_str.strip() else 1
+            end = int(end_str) if end_str.strip() else None
+        else:
+            start = end = int(part)
+
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"不正なページ範囲です: {part}")
+        ranges.append((start, end))
+
+    if not ranges:
+        raise ValueError(f"ページ範囲が指定されていません: {spec!r}")
+    return ranges
+
+
+def resolve_pages(ranges: list[tuple[int, int | None]] | None, total: int) -> list[int]:
+    """
+    ページ範囲を総ページ数で確定させ、対象ページ番号（1始まり）の昇順リストを返す。
+
+    ranges が None の場合は全ページを対象とする。総ページ数を超える指定は切り捨てる。
+
+    Args:
+        ranges (list[tuple[int, int | None]] | None): parse_page_spec の戻り値。
+        total (int): 総ページ数。
+
+    Returns:
+        list[int]: 対象ページ番号の昇順リスト。
+    """
+    if ranges is None:
+        return list(range(1, total + 1))
+
+    pages = set()
+    for start, end in ranges:
+        last = total if end is None else min(end, total)
+        pages.update(range(start, last + 1))
+
+    if not pages:
+        logger.warning(f"指定されたページ範囲に該当するページがありません（総ページ数: {total}）。")
+    return sorted(pages)
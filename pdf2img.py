@@ -6,9 +6,22 @@ dependencies:
 """
 import argparse
 import logging
+import os
+import sys
 from pathlib import Path
 import fitz  # PyMuPDF
 
+try:
+    import resource  # Unix のみ
+except ImportError:
+    resource = None
+
+import grayscale
+import thumbnails
+from cli_types import positive_int
+from converter_errors import ConverterError, InputNotFoundError, InvalidInputError, OutputError
+from page_range import parse_page_spec, resolve_pages
+
 # ログ設定
 logging.basicConfig(
     level=logging.INFO,
@@ -17,13 +30,189 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def extract_images(pdf_file_path: Path, output_dir: Path):
+# メモリ上限を指定した場合に、RSSを取得できない環境でキャッシュを解放するページ間隔
+DEFAULT_SHRINK_INTERVAL = 50
+
+# 開き直してもRSSが上限を下回らなかった場合に、次にRSSを理由として開き直すまでの最小ページ数
+MIN_REOPEN_INTERVAL = 50
+
+
+def current_rss() -> int | None:
+    """
+    現在の常駐メモリ（RSS）をバイト数で返す。取得できない環境では None を返す。
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def peak_rss() -> int | None:
+    """
+    プロセス開始以降の最大常駐メモリ（RSS）をバイト数で返す。取得できない環境では None を返す。
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux はキロバイト、macOS はバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def open_pdf(pdf_file_path: Path):
+    """
+    PDFファイルを開く。
+
+    Raises:
+        InvalidInputError: PDFファイルを開けない場合。
+    """
+    try:
+        return fitz.open(pdf_file_path)
+    except Exception as e:
+        raise InvalidInputError(f"{pdf_file_path} を開けませんでした - {e}") from e
+
+
+def iter_images(pdf_file_path: Path, pages: list[tuple[int, int | None]] | None = None,
+                max_rss: int | None = None, reopen_interval: int | None = None):
+    """
+    PDFファイルから画像をページ順に取り出し、(連番, 出力ファイル名, 画像データ) を返すジェネレーター。
+
+    max_rss または reopen_interval を指定するとメモリ制限モードで処理する。
+    RSSが max_rss を超えた時点で MuPDF のキャッシュ（ストア）を空にし、それでも超えている場合はPDFを開き直す。
+    開き直してもRSSが上限を下回らない場合は警告を1度だけ出力し、以降は MIN_REOPEN_INTERVAL ページ以上の間隔を空ける。
+    RSSを取得できない環境では DEFAULT_SHRINK_INTERVAL ページごとにキャッシュを空にする。
+
+    Args:
+        pdf_file_path (Path): 入力PDFファイルのパス。
+        pages (list[tuple[int, int | None]] | None): 処理するページ範囲（parse_page_spec の戻り値）。
+            None の場合は全ページを処理する。
+        max_rss (int | None): RSSの上限（バイト）。
+        reopen_interval (int | None): 指定したページ数（対象ページの数）を処理するごとにPDFを開き直す。
+
+    Raises:
+        InputNotFoundError: PDFファイルが見つからない場合。
+        InvalidInputError: PDFファイルを開けない場合。
+    """
+    if not Path(pdf_file_path).is_file():
+        raise InputNotFoundError(f"PDFファイルが見つかりません: {pdf_file_path}")
+
+    # PDFファイルを開く
+    logger.info("PDFファイルを開こうとしています...")
+    doc = open_pdf(pdf_file_path)
+    logger.info("PDFファイルを正常に開きました。")
+
+    logger.info(f"{pdf_file_path} を開きました。画像を抽出します...")
+
+    bounded = max_rss is not None or reopen_interval is not None
+    if max_rss is not None and current_rss() is None:
+        logger.warning(f"メモリ使用量を取得できないため、{DEFAULT_SHRINK_INTERVAL} ページごとにキャッシュを解放します。")
+
+    # 処理した対象ページ数、RSSを理由とした再オープンの最小間隔と最後に開き直した時点の処理ページ数
+    processed = 0
+    reopen_count = 0
+    min_reopen_gap = 1
+    last_reopen = 0
+    warned_unreachable = False
+    try:
+        # 画像抽出カウンター
+        image_counter = 0
+
+        # 対象ページ（0始まり）
+        target_indexes = {page_no - 1 for page_no in resolve_pages(pages, len(doc))}
+        last_index = max(target_indexes, default=-1)
+
+        # 各ページを順番に処理
+        for page_index in range(last_index + 1):
+            if page_index not in target_indexes:
+                # 対象外のページはページオブジェクトを読み込まず、連番の維持に必要な画像数のみ数える
+                image_counter += len(doc.get_page_images(page_index))
+                continue
+
+            page = doc.load_page(page_index)
+            image_list = page.get_images(full=True)
+            # 画像の一覧を取得した後はページオブジェクトを保持しない
+            del page
+
+            if image_list:
+                logger.info(f"ページ {page_index + 1} から {len(image_list)} 件の画像を検出しました。")
+
+            # 検出した画像を返す
+            for image_index, img in enumerate(image_list, start=1):
+                xref = img[0]
+                base_image = doc.extract_image(xref)
+
+                # 出力ファイル名を生成
+                image_counter += 1
+                yield image_counter, f"{image_counter:04d}.{base_image['ext']}", base_image["image"]
+                del base_image
+
+            if not bounded:
+                continue
+
+            # メモリ制限モード: ページごとにRSSを確認し、上限を超えたらキャッシュの解放・PDFの再オープンを行う
+            processed += 1
+            rss = current_rss()
+            reopen = reopen_interval is not None and processed % reopen_interval == 0
+            over_limit = False
+            if max_rss is not None and (rss is None and processed % DEFAULT_SHRINK_INTERVAL == 0
+                                        or rss is not None and rss > max_rss):
+                fitz.TOOLS.store_shrink(100)
+                rss = current_rss()
+                over_limit = rss is not None and rss > max_rss
+                if over_limit and processed - last_reopen >= min_reopen_gap:
+                    logger.debug(f"RSSが上限を超えているため、PDFを開き直します（{rss / 2 ** 20:.1f} MB）。")
+                    reopen = True
+            if reopen and page_index < last_index:
+                doc.close()
+                # 開き直しに失敗した場合に、閉じたドキュメントを finally で閉じ直さないようにする
+                doc = None
+                fitz.TOOLS.store_shrink(100)
+                doc = open_pdf(pdf_file_path)
+                reopen_count += 1
+                last_reopen = processed
+                if over_limit:
+                    rss = current_rss()
+                    if rss is not None and rss > max_rss:
+                        # 開き直しても上限を下回らない場合は、毎ページ開き直さないよう間隔を空ける
+                        min_reopen_gap = MIN_REOPEN_INTERVAL
+                        if not warned_unreachable:
+                            logger.warning(f"PDFを開き直してもRSSが上限を下回りません（{rss / 2 ** 20:.1f} MB）。"
+                                           f"以降は {MIN_REOPEN_INTERVAL} ページ以上の間隔を空けて開き直します。")
+                            warned_unreachable = True
+                    else:
+                        min_reopen_gap = 1
+    finally:
+        if doc is not None:
+            doc.close()
+
+    if reopen_count:
+        logger.info(f"メモリ制限のため、PDFを {reopen_count} 回開き直しました。")
+
+
+def extract_images(pdf_file_path: Path, output_dir: Path, pages: list[tuple[int, int | None]] | None = None,
+                   to_grayscale: bool = False, gray_tolerance: int = grayscale.DEFAULT_TOLERANCE,
+                   workers: int | None = None, gray_report_path: Path | None = None, max_rss: int | None = None,
+                   reopen_interval: int | None = None) -> list[Path]:
     """
     PDFファイルから画像を抽出し、指定されたディレクトリに保存する。
 
     Args:
         pdf_file_path (Path): 入力PDFファイルのパス。
         output_dir (Path): 画像を保存するディレクトリのパス。
+        pages (list[tuple[int, int | None]] | None): 処理するページ範囲（parse_page_spec の戻り値）。
+            None の場合は全ページを処理する。
+        to_grayscale (bool): 実質的にグレースケールの画像を8ビットグレースケールで保存し直す場合は True。
+        gray_tolerance (int): グレースケール判定で無彩色とみなす色差の上限。
+        workers (int | None): グレースケール判定のワーカープロセス数。None の場合はCPU数。
+        gray_report_path (Path | None): グレースケール判定のレポート（CSV）の出力先。
+        max_rss (int | None): メモリ制限モードのRSSの上限（バイト）。詳細は iter_images を参照。
+        reopen_interval (int | None): 指定したページ数を処理するごとにPDFを開き直す。
+
+    Returns:
+        list[Path]: 保存した画像ファイルのパス（ページ順）。
+
+    Raises:
+        ConverterError: PDFファイルを開けない場合、または出力ディレクトリの作成・画像の保存に失敗した場合。
     """
     logger.info("スクリプトを開始します。")
     logger.info(f"PDFファイルパス: {pdf_file_path}")
@@ -31,50 +220,42 @@ def extract_images(pdf_file_path: Path, output_dir: Path):
 
     # --- 出力ディレクトリの作成 ---
     logging.info(f"出力ディレクトリを確認・作成します: {output_dir}")
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    # PDFファイルを開く
-    logger.info("PDFファイルを開こうとしています...")
     try:
-        doc = fitz.open(pdf_file_path)
-        logger.info("PDFファイルを正常に開きました。")
-    except Exception as e:
-        logger.error(f"エラー: {pdf_file_path} を開けませんでした - {e}")
-        exit()
-
-    logger.info(f"{pdf_file_path} を開きました。画像を抽出します...")
-
-    # 画像抽出カウンター
-    image_counter = 0
+        output_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        raise OutputError(f"出力ディレクトリ {output_dir} を作成できませんでした - {e}") from e
 
-    # 各ページを順番に処理
-    for page_index in range(len(doc)):
-        page = doc.load_page(page_index)
-        image_list = page.get_images(full=True)
+    saved_paths = []
+    for image_counter, image_filename, image_bytes in iter_images(pdf_file_path, pages, max_rss=max_rss,
+                                                                  reopen_interval=reopen_interval):
+        output_path = output_dir / image_filename
 
-        if image_list:
-            logger.info(f"ページ {page_index + 1} から {len(image_list)} 件の画像を検出しました。")
+        try:
+            output_path.write_bytes(image_bytes)
+        except OSError as e:
+            raise OutputError(f"{output_path} の保存中にエラーが発生しました - {e}") from e
+        logger.info(f"保存しました: {output_path}")
+        saved_paths.append(output_path)
 
-        # 検出した画像を保存
-        for image_index, img in enumerate(image_list, start=1):
-            xref = img[0]
-            base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            image_ext = base_image["ext"]
+    # 保存した画像のうち、グレースケールと判定したものを上書き保存する
+    if to_grayscale:
+        logger.info("グレースケールの画像を判定しています...")
+        converted, reports = grayscale.convert_images([(path.name, path) for path in saved_paths], workers=workers,
+                                                      tolerance=gray_tolerance)
+        for path, data in zip(saved_paths, converted):
+            if data is not None:
+                try:
+                    path.write_bytes(data)
+                except OSError as e:
+                    raise OutputError(f"{path} の保存中にエラーが発生しました - {e}") from e
+        if gray_report_path is not None:
+            grayscale.write_report(reports, gray_report_path)
 
-            # 出力ファイル名を生成
-            image_counter += 1
-            image_filename = f"{image_counter:04d}.{image_ext}"
-            output_path = output_dir / image_filename
-
-            try:
-                output_path.write_bytes(image_bytes)
-                logger.info(f"保存しました: {output_path}")
-            except Exception as e:
-                logger.error(f"エラー: {output_path} の保存中にエラーが発生しました - {e}")
-
-    doc.close()
-    logger.info(f"処理が完了しました。{image_counter} 件の画像を保存しました。")
+    logger.info(f"処理が完了しました。{len(saved_paths)} 件の画像を保存しました。")
+    peak = peak_rss()
+    if peak is not None:
+        logger.info(f"最大メモリ使用量（RSS）: {peak / 2 ** 20:.1f} MB")
+    return saved_paths
 
 def main():
     """
@@ -86,11 +267,31 @@ def main():
         formatter_class=argparse.RawTextHelpFormatter
     )
     parser.add_argument("-i", "--input-pdf", type=Path, required=True, help="画像抽出の対象となるPDFファイルのパス。")
+    parser.add_argument("--pages", type=parse_page_spec, default=None,
+                        help="処理するページ範囲 (例: 1-3,7,10-)。連番は全ページ処理時と同じ番号を使用する。")
+    parser.add_argument("--max-rss", type=positive_int, default=None,
+                        help="メモリ制限モードで処理し、RSSがこの値（MB）を超えたらキャッシュの解放やPDFの再オープンを行う。")
+    parser.add_argument("--reopen-interval", type=positive_int, default=None,
+                        help="指定したページ数を処理するごとにPDFを開き直す。")
+    grayscale.add_grayscale_arguments(parser)
+    thumbnails.add_thumbnail_arguments(parser)
     args = parser.parse_args()
     
     # 入力PDFファイルのあるディレクトリに、PDFのファイル名（拡張子なし）のディレクトリを作成する
     output_dir = args.input_pdf.parent / args.input_pdf.stem
-    extract_images(args.input_pdf, output_dir)
+    try:
+        saved_paths = extract_images(args.input_pdf, output_dir, args.pages, to_grayscale=args.grayscale,
+                                     gray_tolerance=args.gray_tolerance, workers=args.workers,
+                                     gray_report_path=args.gray_report,
+                                     max_rss=args.max_rss * 2 ** 20 if args.max_rss is not None else None,
+                                     reopen_interval=args.reopen_interval)
+        if args.thumbnails:
+            # 今回保存した画像のみを対象とし、以前の実行で保存した画像のサムネイルは作り直さない
+            thumbnails.create_thumbnails(output_dir, output_dir / "thumbnails", size=args.thumbnail_size,
+                                         sprite=args.thumbnail_sprite, files=saved_paths)
+    except ConverterError as e:
+        logger.error(f"エラー: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
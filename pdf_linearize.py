@@ -0,0 +1,118 @@
+"""
+PDFを線形化（Web表示用に最適化）して保存する共通モジュール
+
+dependencies:
+    uv add pikepdf
+"""
+import io
+import logging
+import mmap
+import re
+from pathlib import Path
+import pikepdf
+
+logger = logging.getLogger(__name__)
+
+# 線形化パラメータ辞書はファイル先頭1024バイト以内に置かれる（PDF仕様 F.2）
+LINEARIZATION_DICT_LIMIT = 1024
+
+
+def save_linearized(pdf: pikepdf.Pdf, output) -> dict:
+    """
+    オブジェクトストリームと圧縮xrefストリームを使用して、PDFを線形化して保存する。
+
+    Args:
+        pdf (pikepdf.Pdf): 保存するPDF。
+        output: 出力先のパス、またはバイナリ書き込み可能なストリーム。
+
+    Returns:
+        dict: get_linearization_info の戻り値。
+    """
+    # object_stream_mode=generate でオブジェクトストリームを生成すると、xrefもストリーム形式で圧縮される
+    save_options = {
+        "linearize": True,
+        "object_stream_mode": pikepdf.ObjectStreamMode.generate,
+        "compress_streams": True,
+    }
+    if isinstance(output, (str, Path)):
+        pdf.save(output, **save_options)
+        info = get_linearization_info(Path(output))
+    else:
+        # ストリームの場合は線形化情報を読み取るため、一度メモリ上に保存する
+        buffer = io.BytesIO()
+        pdf.save(buffer, **save_options)
+        info = parse_linearization_info(buffer.getbuffer())
+        output.write(buffer.getbuffer())
+    log_linearization_info(info)
+    return info
+
+
+def get_linearization_info(pdf_path: Path) -> dict:
+    """
+    線形化PDFの線形化パラメータ辞書を読み取り、1ページ目の位置とファイルサイズを返す。
+
+    Args:
+        pdf_path (Path): 線形化PDFのパス。
+
+    Returns:
+        dict: parse_linearization_info の戻り値。
+    """
+    if pdf_path.stat().st_size == 0:
+        return parse_linearization_info(b"")
+
+    with pdf_path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return parse_linearization_info(mm)
+
+
+def parse_linearization_info(data) -> dict:
+    """
+    線形化PDFのデータから線形化パラメータ辞書を読み取り、1ページ目の位置とファイルサイズを返す。
+
+    Args:
+        data: PDFのデータ（bytes、memoryview、mmap など）。
+
+    Returns:
+        dict: 以下のキーを持つ辞書。線形化されていない場合は first_page_* が None となる。
+            first_page_offset (int | None): 1ページ目のページオブジェクトの開始バイト位置。
+            first_page_end (int | None): 1ページ目の表示に必要なデータの終端バイト位置（/E）。
+            total_size (int): ファイルサイズ（バイト）。
+    """
+    total_size = len(data)
+    info = {"first_page_offset": None, "first_page_end": None, "total_size": total_size}
+
+    head = bytes(data[:LINEARIZATION_DICT_LIMIT])
+    dict_match = re.search(rb"/Linearized\b(.*?)>>", head, re.DOTALL)
+    if dict_match is None:
+        return info
+
+    lin_dict = dict_match.group(1)
+    end_match = re.search(rb"/E\s+(\d+)", lin_dict)
+    obj_match = re.search(rb"/O\s+(\d+)", lin_dict)
+    if end_match is None or obj_match is None:
+        return info
+
+    first_page_end = int(end_match.group(1))
+    info["first_page_end"] = first_page_end
+
+    # 1ページ目のページオブジェクトは先頭から /E までの範囲に置かれる
+    page_obj = re.compile(rb"(?<!\d)" + obj_match.group(1) + rb"\s+0\s+obj\b")
+    page_match = page_obj.search(data, 0, min(first_page_end, total_size))
+    if page_match is not None:
+        info["first_page_offset"] = page_match.start()
+
+    return info
+
+
+def log_linearization_info(info: dict):
+    """
+    線形化情報をログに出力する。
+    """
+    total_size = info["total_size"]
+    if info["first_page_end"] is None:
+        logger.warning(f"線形化情報を取得できませんでした（ファイルサイズ: {total_size:,} バイト）。")
+        return
+    if info["first_page_offset"] is not None:
+        logger.info(f"  1ページ目のオフセット: {info['first_page_offset']:,} バイト")
+    logger.info(f"  1ページ目の表示に必要なサイズ: {info['first_page_end']:,} バイト"
+                f" ({info['first_page_end'] / total_size:.1%})")
+    logger.info(f"  総ファイルサイズ: {total_size:,} バイト")
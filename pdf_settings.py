@@ -10,6 +10,8 @@ import sys
 from pathlib import Path
 import pikepdf
 
+from pdf_linearize import save_linearized
+
 # ログ設定
 logging.basicConfig(
     level=logging.INFO,
@@ -18,7 +20,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def set_pdf_settings(pdf_path: Path, layout: str, direction: str):
+def set_pdf_settings(pdf_path: Path, layout: str, direction: str, linearize: bool = False):
     if not pdf_path.is_file():
         logger.error(f"ファイルが見つかりません: {pdf_path}")
         return
@@ -44,7 +46,11 @@ def set_pdf_settings(pdf_path: Path, layout: str, direction: str):
             pdf.Root.ViewerPreferences.Direction = pikepdf.Name(direction)
 
             # ファイルを保存（上書き）
-            pdf.save(pdf_path)
+            if linearize:
+                # Web表示用に線形化し、オブジェクトストリームと圧縮xrefストリームで保存する
+                save_linearized(pdf, pdf_path)
+            else:
+                pdf.save(pdf_path)
             
             logger.info(f"設定を更新しました: {pdf_path}")
             logger.info(f"  PageLayout: {layout}")
@@ -66,10 +72,13 @@ def main():
     # -d / --direction
     parser.add_argument("-d", "--direction", type=str, default="/L2R", 
                         help="表示方向 (例: /L2R, /R2L)。初期値: /L2R")
+    # --linearize
+    parser.add_argument("--linearize", action="store_true",
+                        help="Web表示用に線形化し、オブジェクトストリームと圧縮xrefストリームで保存する。")
 
     args = parser.parse_args()
 
-    set_pdf_settings(args.pdf, args.layout, args.direction)
+    set_pdf_settings(args.pdf, args.layout, args.direction, args.linearize)
 
 if __name__ == "__main__":
     main()
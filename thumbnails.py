@@ -0,0 +1,291 @@
+"""
+画像フォルダ・PDFファイル・EPUBファイルからページのサムネイルを作成するスクリプト
+
+dependencies:
+    uv add pillow PyMuPDF
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import fitz  # PyMuPDF
+from PIL import Image
+
+from cli_types import positive_int
+from converter_errors import ConverterError, InputNotFoundError, InvalidInputError, OutputError
+from page_range import parse_page_spec, resolve_pages
+
+# ログ設定
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%H:%M:%S"
+)
+logger = logging.getLogger(__name__)
+
+# 画像フォルダから読み込む画像の拡張子
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tif", ".tiff")
+
+# サムネイルのJPEG品質
+THUMBNAIL_QUALITY = 80
+
+# スプライトシートのファイル名
+SPRITE_FILENAME = "sprite.jpg"
+SPRITE_INDEX_FILENAME = "sprite.json"
+
+
+def make_thumbnail(image_source, size: int) -> Image.Image:
+    """
+    画像を縮小してサムネイルを作成する。
+
+    JPEGの場合はドラフトモードでDCT領域の縮小デコードを行い、フル解像度の展開を避ける。
+
+    Args:
+        image_source: 画像ファイルのパス、またはファイルライクオブジェクト。
+        size (int): サムネイルの長辺の最大ピクセル数。
+
+    Returns:
+        Image.Image: RGBのサムネイル画像。
+    """
+    with Image.open(image_source) as img:
+        # JPEG以外では何もしない
+        img.draft("RGB", (size, size))
+        thumb = img.convert("RGB")
+    thumb.thumbnail((size, size))
+    return thumb
+
+
+def encode_thumbnail(thumb: Image.Image) -> bytes:
+    """
+    サムネイルをJPEGにエンコードする。
+    """
+    buffer = io.BytesIO()
+    thumb.save(buffer, format="JPEG", quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+
+def _thumbnail_image_files(tasks: list[tuple[int, str, str]], size: int) -> list[tuple[int, str, bytes]]:
+    """
+    （ワーカープロセス）画像ファイルのサムネイルを作成する。
+    """
+    results = []
+    for seq, name, path in tasks:
+        try:
+            results.append((seq, name, encode_thumbnail(make_thumbnail(path, size))))
+        except Exception as e:
+            logger.warning(f"サムネイルを作成できませんでした: {path} - {e}")
+    return results
+
+
+def _thumbnail_epub_members(epub_path: str, tasks: list[tuple[int, str, str]],
+                            size: int) -> list[tuple[int, str, bytes]]:
+    """
+    （ワーカープロセス）EPUB内の画像のサムネイルを作成する。ZIPはワーカーごとに開く。
+    """
+    results = []
+    with zipfile.ZipFile(epub_path, "r") as z:
+        for seq, name, image_zip_path in tasks:
+            try:
+                with z.open(image_zip_path) as f:
+                    thumb = make_thumbnail(io.BytesIO(f.read()), size)
+                results.append((seq, name, encode_thumbnail(thumb)))
+            except Exception as e:
+                logger.warning(f"サムネイルを作成できませんでした: {image_zip_path} - {e}")
+    return results
+
+
+def _thumbnail_pdf_pages(pdf_path: str, tasks: list[tuple[int, str, int]], size: int) -> list[tuple[int, str, bytes]]:
+    """
+    （ワーカープロセス）PDFのページを低解像度でレンダリングしてサムネイルを作成する。PDFはワーカーごとに開く。
+    """
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for seq, name, page_index in tasks:
+            try:
+                page = doc.load_page(page_index)
+                # 長辺が size ピクセルになる倍率でレンダリングする
+                scale = size / max(page.rect.width, page.rect.height)
+                pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+                thumb = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                results.append((seq, name, encode_thumbnail(thumb)))
+            except Exception as e:
+                logger.warning(f"サムネイルを作成できませんでした: {pdf_path} {page_index + 1}ページ - {e}")
+    return results
+
+
+def collect_tasks(input_path: Path, pages: list[tuple[int, int | None]] | None = None,
+                  files: list[Path] | None = None) -> tuple:
+    """
+    入力の種類を判定し、サムネイル作成処理と (連番, 出力名, 対象) のリストを返す。
+
+    Args:
+        input_path (Path): 画像フォルダ、PDFファイル、またはEPUBファイルのパス。
+        pages (list[tuple[int, int | None]] | None): 処理するページ範囲（parse_page_spec の戻り値）。
+        files (list[Path] | None): 画像フォルダの場合に対象とする画像ファイル。None の場合はフォルダ内のすべての画像。
+
+    Returns:
+        tuple: (ワーカー関数, ワーカー関数の先頭引数のタプル, タスクのリスト)。
+
+    Raises:
+        InputNotFoundError: 入力が見つからない場合。
+        InvalidInputError: 入力を開けない、または解析できない場合。
+    """
+    # pdf2img・epub2img は本モジュールをインポートするため、循環インポートを避けて使用時に読み込む
+    import epub2img
+    import pdf2img
+
+    if not input_path.exists():
+        raise InputNotFoundError(f"入力が見つかりません: {input_path}")
+
+    if input_path.is_dir():
+        if files is not None:
+            image_files = [p for p in files if p.suffix.lower() in IMAGE_SUFFIXES]
+        else:
+            image_files = [p for p in input_path.iterdir() if p.is_file() and p.suffix.lower() in IMAGE_SUFFIXES]
+        image_files.sort(key=lambda f: f.stem)
+        tasks = [(page_no, image_files[page_no - 1].stem, str(image_files[page_no - 1]))
+                 for page_no in resolve_pages(pages, len(image_files))]
+        return _thumbnail_image_files, (), tasks
+
+    suffix = input_path.suffix.lower()
+    if suffix == ".pdf":
+        with pdf2img.open_pdf(input_path) as doc:
+            page_count = len(doc)
+        tasks = [(page_no, f"{page_no:04d}", page_no - 1) for page_no in resolve_pages(pages, page_count)]
+        return _thumbnail_pdf_pages, (str(input_path),), tasks
+
+    if suffix == ".epub":
+        with epub2img.open_epub(input_path) as z:
+            image_paths = epub2img.resolve_epub(z, pages=pages)
+        tasks = [(seq, Path(epub2img.output_filename(seq, image_zip_path)).stem, image_zip_path)
+                 for seq, image_zip_path in image_paths]
+        return _thumbnail_epub_members, (str(input_path),), tasks
+
+    raise InvalidInputError(f"サポートされていない入力です: {input_path}")
+
+
+def write_sprite(results: list[tuple[int, str, bytes]], output_dir: Path, size: int, columns: int):
+    """
+    サムネイルを1枚のスプライトシートにまとめ、各サムネイルの位置をJSONのインデックスに出力する。
+    """
+    rows = (len(results) + columns - 1) // columns
+    sprite = Image.new("RGB", (size * min(columns, len(results)), size * rows), "white")
+    index = []
+    for position, (seq, name, data) in enumerate(results):
+        with Image.open(io.BytesIO(data)) as thumb:
+            x = (position % columns) * size
+            y = (position // columns) * size
+            sprite.paste(thumb, (x, y))
+            index.append({"seq": seq, "name": name, "x": x, "y": y, "width": thumb.width, "height": thumb.height})
+
+    sprite_path = output_dir / SPRITE_FILENAME
+    sprite.save(sprite_path, format="JPEG", quality=THUMBNAIL_QUALITY)
+    index_path = output_dir / SPRITE_INDEX_FILENAME
+    index_path.write_text(
+        json.dumps({"sprite": SPRITE_FILENAME, "cell_size": size, "columns": columns, "pages": index},
+                   ensure_ascii=False, indent=2),
+        encoding="utf-8"
+    )
+    logger.info(f"スプライトシートを保存しました: {sprite_path}")
+    logger.info(f"インデックスを保存しました: {index_path}")
+
+
+def create_thumbnails(input_path: Path, output_dir: Path, size: int = 256, sprite: bool = False,
+                      columns: int = 10, workers: int | None = None,
+                      pages: list[tuple[int, int | None]] | None = None, files: list[Path] | None = None):
+    """
+    画像フォルダ・PDFファイル・EPUBファイルからサムネイルを作成する。
+
+    Args:
+        input_path (Path): 画像フォルダ、PDFファイル、またはEPUBファイルのパス。
+        output_dir (Path): サムネイルを保存するディレクトリのパス。
+        size (int): サムネイルの長辺の最大ピクセル数。
+        sprite (bool): True の場合、個別ファイルの代わりにスプライトシートとインデックスを出力する。
+        columns (int): スプライトシートの列数。
+        workers (int | None): ワーカープロセス数。None の場合はCPU数。
+        pages (list[tuple[int, int | None]] | None): 処理するページ範囲（parse_page_spec の戻り値）。
+        files (list[Path] | None): 画像フォルダの場合に対象とする画像ファイル。抽出直後の画像のみを対象とする場合に指定する。
+
+    Raises:
+        ConverterError: 入力を開けない場合、または出力ディレクトリを作成できない場合。
+    """
+    worker, worker_args, tasks = collect_tasks(input_path, pages, files)
+    if not tasks:
+        logger.warning(f"サムネイルを作成する対象が見つかりません: {input_path}")
+        return
+
+    logging.info(f"出力ディレクトリを確認・作成します: {output_dir}")
+    try:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        raise OutputError(f"出力ディレクトリを作成できませんでした: {output_dir} - {e}") from e
+
+    # ワーカーごとに入力を開き直すコストを抑えるため、タスクをまとめて割り当てる
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, (len(tasks) + workers * 4 - 1) // (workers * 4))
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+    logger.info(f"{len(tasks)} ページのサムネイルを {workers} プロセスで作成します...")
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker, *worker_args, chunk, size) for chunk in chunks]
+        for future in futures:
+            results.extend(future.result())
+
+    if not results:
+        logger.warning("サムネイルを1件も作成できませんでした。")
+        return
+
+    if sprite:
+        write_sprite(results, output_dir, size, columns)
+    else:
+        for seq, name, data in results:
+            (output_dir / f"{name}.jpg").write_bytes(data)
+    logger.info(f"処理が完了しました。{len(results)} / {len(tasks)} 件のサムネイルを作成しました。")
+
+
+def add_thumbnail_arguments(parser: argparse.ArgumentParser):
+    """
+    抽出スクリプトにサムネイル作成用のコマンドライン引数を追加する。
+    """
+    parser.add_argument("--thumbnails", action="store_true",
+                        help="抽出後に出力ディレクトリ内の thumbnails ディレクトリへサムネイルを作成する。")
+    parser.add_argument("--thumbnail-size", type=positive_int, default=256, help="サムネイルの長辺のピクセル数（初期値: 256）。")
+    parser.add_argument("--thumbnail-sprite", action="store_true",
+                        help="サムネイルを個別ファイルではなくスプライトシートとインデックスで出力する。")
+
+
+def main():
+    """
+    コマンドライン引数を処理し、サムネイル作成処理を実行する。
+    """
+    parser = argparse.ArgumentParser(
+        description="画像フォルダ・PDFファイル・EPUBファイルからページのサムネイルを作成するスクリプト",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("-i", "--input", type=Path, required=True, help="画像フォルダ、PDFファイル、またはEPUBファイルのパス。")
+    parser.add_argument("-o", "--output-dir", type=Path, default=None,
+                        help="サムネイルの保存先。初期値は入力と同じ場所の「入力名_thumbnails」ディレクトリ。")
+    parser.add_argument("--size", type=positive_int, default=256, help="サムネイルの長辺のピクセル数（初期値: 256）。")
+    parser.add_argument("--sprite", action="store_true", help="個別ファイルではなくスプライトシートとインデックスを出力する。")
+    parser.add_argument("--columns", type=positive_int, default=10, help="スプライトシートの列数（初期値: 10）。")
+    parser.add_argument("--workers", type=positive_int, default=None, help="ワーカープロセス数（初期値: CPU数）。")
+    parser.add_argument("--pages", type=parse_page_spec, default=None, help="処理するページ範囲 (例: 1-3,7,10-)。")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or args.input.parent / f"{args.input.stem}_thumbnails"
+    try:
+        create_thumbnails(args.input, output_dir, size=args.size, sprite=args.sprite, columns=args.columns,
+                          workers=args.workers, pages=args.pages)
+    except ConverterError as e:
+        logger.error(f"エラーが発生しました: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()